@@ -1,63 +1,247 @@
 # -*- coding: utf-8 -*-
 
 from flask import (
-    Flask, render_template, Response, request,
+    Flask, Request, render_template, Response, request,
     render_template_string, redirect, url_for, send_file, jsonify
 )
-import serial
+import hmac
 import json
 from datetime import datetime
 import threading
 import queue
 import time
 import os
+import socket
+import signal
 import subprocess
 import sqlite3
-import io
-
-from gpiozero import MotionSensor, RGBLED
+import atexit
+import zlib
+import multiprocessing
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from credentials import CredentialStore, CREDENTIALS_TABLE_SQL, CREDENTIAL_COLUMNS, normalize_uid, parse_schedule
+from readers import ReaderLoop, open_serial
+from sse_async import AsyncSSEServer
+from pubsub import Hub, Link
+from metrics import Registry, Counter, Gauge, Histogram
+from tracing import Tracer
+from zones import Zone, ZoneEngine
+from camera import CaptureEngine, FfmpegMjpegSource, SyntheticFrameSource, select_sharpest
+from photostore import (
+    PhotoStore, HashingWriter, FileTooLarge, PHOTOS_TABLE_SQL, PHOTOS_SCHEMA_VERSION,
+    export_blobs, make_renditions
+)
 
 # ------------------ PATHS ------------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# databases and photos, PI_SPACE_DATA_DIR puts them elsewhere (simulator)
+DATA_DIR = os.environ.get("PI_SPACE_DATA_DIR", BASE_DIR)
+
+PHOTOS_DB = os.path.join(DATA_DIR, "photos.db")   # only photos
+EVENTS_DB = os.path.join(DATA_DIR, "events.db")   # only motion + rfid logs
+CREDENTIALS_DB = os.path.join(DATA_DIR, "credentials.db")   # RFID cards
 
-PHOTOS_DB = os.path.join(BASE_DIR, "photos.db")   # only photos
-EVENTS_DB = os.path.join(BASE_DIR, "events.db")   # only motion + rfid logs
+PHOTO_DIR = os.path.join(DATA_DIR, "static", "photos")  # absolute, content-addressed photo files
+CHANNEL_SOCKET = os.path.join(DATA_DIR, "sensor.sock")   # sensor process -> web workers
 
-PHOTO_DIR = os.path.join(BASE_DIR, "static", "photos")  # absolute
 
 # ------------------ CONFIG ------------------
+def env_pairs(name, default):
+    """"a=x,b=y" from environment variable `name` as {"a": "x", "b": "y"}, `default` if unset."""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return dict(pair.split("=", 1) for pair in value.split(","))
+
+
 SERIAL_PORT = "/dev/ttyACM0"
 BAUDRATE = 9600
 
-# Limits
+
+def default_rfid_readers():
+    # door id -> serial port of its RFID Arduino, all served by one reader thread
+    return env_pairs("PI_SPACE_RFID_READERS", {
+        "main": SERIAL_PORT,
+    })
+
+
+# rebuilt by configure() unless set explicitly, so SERIAL_PORT keeps working
+RFID_READERS = default_rfid_readers()
+RFID_RECONNECT_SECONDS = 2.0       # first retry of a failed port, doubles up to the max
+RFID_MAX_RECONNECT_SECONDS = 30.0
+
+# Limits (used by RETENTION_POLICIES below)
 MAX_PHOTOS = 250
 MAX_EVENTS = 250
 
+# Retention
+RETENTION_SLACK = 0.1                 # a table may grow 10% over a limit before it is trimmed
+RETENTION_INTERVAL_SECONDS = 30.0     # background pass (age limits, counter checks)
+RETENTION_RESYNC_SECONDS = 3600.0     # full recount to correct counter drift
+RETENTION_DELETE_BATCH = 1000         # ids per DELETE transaction
+
+# DB writer (group commit)
+DB_BATCH_MAX = 64                 # max write requests per transaction
+DB_BATCH_WINDOW_SECONDS = 0.01    # how long a burst waits for more requests, a lone write commits at once
+DB_SYNCHRONOUS = "FULL"           # PRAGMA synchronous for the writer connections
+
+# Recent events kept in memory (dashboard, /debug/events, SSE replay)
+EVENTS_CACHE_SIZE = 500
+
+# /api/events
+API_EVENTS_DEFAULT_LIMIT = 50
+API_EVENTS_MAX_LIMIT = 500
+
 # PIR
 PIR_PIN = 18
-MOTION_COOLDOWN_SECONDS = 2.0
+MOTION_COOLDOWN_SECONDS = float(os.environ.get("PI_SPACE_MOTION_COOLDOWN", 2.0))
+
+
+def default_motion_zones():
+    # one PIR per zone: GPIO pin, own cooldown, camera that takes the photo (None: no photo)
+    # PI_SPACE_MOTION_ZONES="main=18,garage=23" replaces the list (all zones on the default camera)
+    pins = {"main": PIR_PIN}
+    if os.environ.get("PI_SPACE_MOTION_ZONES"):
+        pins = {name: int(pin) for name, pin in env_pairs("PI_SPACE_MOTION_ZONES", {}).items()}
+    return [
+        {"zone": name, "pin": pin, "cooldown": MOTION_COOLDOWN_SECONDS, "camera": "default"}
+        for name, pin in pins.items()
+    ]
+
+
+# rebuilt by configure() unless set explicitly, so PIR_PIN and the cooldown keep working
+MOTION_ZONES = default_motion_zones()
 
 # Camera
 CAMERA_DEVICE = "/dev/video0"
 PHOTO_RESOLUTION = "1280x720"
 
+# Capture engine: keeps the camera open, motion photos come from its frame ring.
+# CAMERA_SOURCE: "ffmpeg" (CAMERA_DEVICE), "synthetic" (no camera) or None (fswebcam per photo)
+CAMERA_SOURCE = os.environ.get("PI_SPACE_CAMERA_SOURCE", "ffmpeg") or None
+CAMERA_INPUT_FORMAT = "mjpeg"          # v4l2 format, anything else is encoded by ffmpeg
+CAMERA_FPS = 10
+CAPTURE_RING_FRAMES = 30               # 3s of history at 10 fps
+CAPTURE_PRE_TRIGGER_SECONDS = 0.0      # >0 prefers a frame from just before the PIR edge
+CAPTURE_MAX_WAIT_SECONDS = 1.0
+
+# Live stream (/stream.mjpg), served from the capture engine's frames
+STREAM_MAX_FPS = 10
+STREAM_MAX_VIEWERS = 16                # every viewer holds one server thread
+STREAM_FRAME_TIMEOUT_SECONDS = 5.0     # end the stream if the camera stops delivering
+
+# Capture queue: bounded, overlapping motion triggers share one capture
+CAPTURE_WORKERS = 1                    # one camera -> one capture at a time
+CAPTURE_QUEUE_SIZE = 4                 # queued captures, further triggers are dropped
+CAPTURE_COALESCE = True
+
+# Burst per motion event (capture engine only): take K frames, keep the sharpest M
+BURST_FRAMES = 5
+BURST_KEEP = 1
+BURST_SCORE_BUDGET_SECONDS = 0.15      # scoring stops after this, unscored frames are skipped
+BURST_SCORE_MAX_SIDE = 320             # frames are scored on a downsampled grayscale
+
+# Thumbnails / previews (max width, max height), generated next to the original
+PHOTO_RENDITIONS = {
+    "thumb": (480, 270),
+    "preview": (960, 540),
+}
+THUMB_WORKERS = 2
+THUMB_WAIT_SECONDS = 5.0   # how long a request waits for a missing rendition
+
+# photos never change once stored (path = content hash), browsers may keep them
+PHOTO_CACHE_SECONDS = 365 * 24 * 3600
+
+# Uploads (/gallery)
+UPLOAD_MAX_BYTES = 200 * 1024 * 1024       # whole request, rejected before reading if Content-Length is larger
+UPLOAD_MAX_FILE_BYTES = 25 * 1024 * 1024   # one image (also inside a zip)
+UPLOAD_ZIP_MAX_FILES = 500
+UPLOAD_WORKERS = 2                         # threads that unpack and hash zip members
+
 # RGB LED Pins
 RGB_RED_PIN = 21
 RGB_GREEN_PIN = 20
 RGB_BLUE_PIN = 26
 
+# SSE (/events)
+SSE_CLIENT_BUFFER = 256          # ring buffer size per connected client
+SSE_MAX_SKIPPED_EVENTS = 2048    # client gets dropped after overrunning this many events
+SSE_HEARTBEAT_SECONDS = 15.0
+SSE_RETRY_MS = 3000
+SSE_REPLAY_LIMIT = 500           # events per page when a reconnect replays the gap from events.db
+# asyncio server for /events (no thread per client), the dashboard connects to it;
+# PI_SPACE_SSE_PORT=0 leaves only Flask's /events
+SSE_ASYNC_PORT = int(os.environ.get("PI_SPACE_SSE_PORT", 5001)) or None
+SSE_ASYNC_MAX_CLIENTS = 5000
+SSE_WRITE_TIMEOUT_SECONDS = 10.0  # a client whose socket does not drain in time is dead
+# the one origin allowed to read the async port cross-origin (e.g. "http://pi:5000"), None: no CORS
+SSE_ASYNC_ALLOW_ORIGIN = os.environ.get("PI_SPACE_SSE_ALLOW_ORIGIN") or None
+# dashboard connects to the async port itself instead of same-origin /events (needs the origin above)
+SSE_DASHBOARD_DIRECT = os.environ.get("PI_SPACE_SSE_DIRECT", "0") == "1"
+
 LED_FEEDBACK_SECONDS = 1.0
 LED_IDLE_COLOR = (0, 0, 1)  # blue
 
+# only seeds credentials.db on the first start, cards are managed via /api/credentials
 ALLOWED_UIDS = {
     "333647F7": "Blauer Chip",
     "61D1AA17": "Weisse Karte",
     "04E0391AC16680": "Angelausweis"
 }
 
+# per-event stage traces (/debug/trace/<event_id>)
+TRACE_MAX_EVENTS = 500     # traces kept for lookup
+TRACE_WINDOW = 1000        # durations per stage for the rolling percentiles
+
+# /api/credentials wants "Authorization: Bearer <token>", without a token the admin API is off
+ADMIN_TOKEN = os.environ.get("PI_SPACE_ADMIN_TOKEN")
+
+# Hardware backends, started by create_app(). HARDWARE=False (PI_SPACE_HARDWARE=0):
+# no serial ports, GPIO or camera at all, e.g. for tests and web-only workers
+HARDWARE = os.environ.get("PI_SPACE_HARDWARE", "1") != "0"
+SERIAL_OPENER = None       # opener(path, baudrate) for the RFID ports, None: pyserial
+GPIO_PIN_FACTORY = None    # gpiozero pin factory for PIR zones and LED, None: gpiozero's default
+FRAME_SOURCE = None        # callable returning the frame source used when CAMERA_SOURCE is set, None: by CAMERA_SOURCE
+
+# Processes (PI_SPACE_ROLE or python app.py --role):
+#   "all"    one process does everything
+#   "sensor" hardware, capture, retention and events.db writes, publishes on CHANNEL_SOCKET, no HTTP
+#   "web"    no hardware, serves dashboard, SSE and photos, follows the sensor process
+ROLE = os.environ.get("PI_SPACE_ROLE", "all")
+ROLES = ("all", "sensor", "web")
+WEB_WORKERS = int(os.environ.get("PI_SPACE_WEB_WORKERS", 1))   # processes of python app.py --role web
+CHANNEL_MAX_BUFFER = 4 * 1024 * 1024   # queued bytes before the sensor process drops a worker
+
 # ------------------ APP ------------------
+class UploadRequest(Request):
+    """Uploaded files are streamed into photo store temp files, hashed on the way."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._upload_streams = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # images are cut off at the per-file limit while streaming, zips only by the request limit
+        is_zip = (filename or "").lower().endswith(".zip") or "zip" in (content_type or "")
+        stream = HashingWriter(photo_store, max_bytes=None if is_zip else UPLOAD_MAX_FILE_BYTES)
+        self._upload_streams.append(stream)
+        return stream
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            # whatever was not committed into the store (rejected, zip archives, aborted)
+            for stream in self._upload_streams:
+                stream.discard()
+
+
 app = Flask(__name__)
-event_queue = queue.Queue()
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES
 
 # ------------------ TIME HELPERS ------------------
 def now_ts():
@@ -67,6 +251,297 @@ def now_ts():
 def now_epoch():
     return time.time()
 
+
+# ------------------ METRICS ------------------
+# served at /metrics (Prometheus text format), gauges are read at scrape time
+metrics_registry = Registry()
+
+capture_seconds = Histogram(
+    metrics_registry, "pispace_capture_seconds", "Motion photo capture (burst or fswebcam)", ["method"])
+db_insert_seconds = Histogram(
+    metrics_registry, "pispace_db_insert_seconds", "Insert submitted to committed", ["table"])
+db_trim_seconds = Histogram(
+    metrics_registry, "pispace_db_trim_seconds", "Retention pass that deleted rows", ["table"])
+rfid_reply_seconds = Histogram(
+    metrics_registry, "pispace_rfid_reply_seconds", "UID line read to AUTH/DENY written", ["door"])
+sse_lag_seconds = Histogram(
+    metrics_registry, "pispace_sse_delivery_lag_seconds", "Event time to SSE write (live events)")
+rfid_decisions = Counter(
+    metrics_registry, "pispace_rfid_decisions_total", "RFID scans by door and result", ["door", "status"])
+motion_triggers = Counter(
+    metrics_registry, "pispace_motion_triggers_total", "Accepted motion triggers", ["zone"])
+
+
+def _db_file_bytes():
+    out = {}
+    for name, path in (("events", EVENTS_DB), ("photos", PHOTOS_DB), ("credentials", CREDENTIALS_DB)):
+        out[(name,)] = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+    return out
+
+
+Gauge(metrics_registry, "pispace_sse_clients", "Connected /events clients", lambda: event_hub.client_count())
+Gauge(metrics_registry, "pispace_sse_async_clients", "Connected clients of the async /events server",
+      lambda: sse_server.client_count() if sse_server else 0)
+Gauge(metrics_registry, "pispace_stream_viewers", "Connected /stream.mjpg viewers", lambda: _stream_viewers)
+Gauge(metrics_registry, "pispace_capture_queue_depth", "Queued capture jobs",
+      lambda: capture_pool.stats()["queue_depth"])
+Gauge(metrics_registry, "pispace_capture_in_flight", "Capture jobs running", lambda: capture_pool.stats()["in_flight"])
+Gauge(metrics_registry, "pispace_db_writer_pending", "Write requests waiting for the DB writer",
+      lambda: db_writer.pending())
+Gauge(metrics_registry, "pispace_thumb_pending", "Photos waiting for thumbnails", lambda: len(_thumb_pending))
+Gauge(metrics_registry, "pispace_events_cache_size", "Events in the in-memory cache", lambda: events_cache.stats()["size"])
+Gauge(metrics_registry, "pispace_db_bytes", "Database file size incl. WAL", _db_file_bytes, ["db"])
+Gauge(metrics_registry, "pispace_db_rows", "Rows per table (retention counters)",
+      lambda: {(t,): v["rows"] or 0 for t, v in retention.stats().items()}, ["table"])
+
+
+# ------------------ TRACING ------------------
+# a motion event_id collects monotonic spans from the PIR edge to the SSE push:
+# dispatch, motion_insert, motion_sse, capture_queue, capture, photo_insert,
+# motion_photo_insert, motion_photo_sse
+stage_seconds = Histogram(metrics_registry, "pispace_stage_seconds", "Traced pipeline stages", ["stage"])
+tracer = Tracer(TRACE_MAX_EVENTS, TRACE_WINDOW, on_span=lambda stage, s: stage_seconds.observe(s, stage))
+
+
+def event_stage(e, step):
+    # "motion_photo_insert", "motion_sse", ...
+    return (e.get("type") or "event").lower() + "_" + step
+
+
+# ------------------ SSE BROADCAST ------------------
+class SSESubscriber:
+    """One connected /events client with its own bounded ring buffer."""
+
+    def __init__(self, buffer_size=SSE_CLIENT_BUFFER, max_skipped=SSE_MAX_SKIPPED_EVENTS):
+        self.buffer = deque(maxlen=buffer_size)
+        self.cond = threading.Condition()
+        self.max_skipped = max_skipped
+        self.skipped = 0        # events overwritten since the last drain
+        self.closed = False
+
+    def push(self, event):
+        with self.cond:
+            if self.closed:
+                return
+            if len(self.buffer) == self.buffer.maxlen:
+                # ring is full -> oldest event falls out, client skips ahead
+                self.skipped += 1
+                if self.skipped > self.max_skipped:
+                    self.closed = True
+            self.buffer.append(event)
+            self.cond.notify()
+
+    def drain(self, timeout):
+        """Wait up to `timeout` seconds, return (events, skipped_count)."""
+        with self.cond:
+            if not self.buffer and not self.closed:
+                self.cond.wait(timeout)
+            events = list(self.buffer)
+            self.buffer.clear()
+            skipped, self.skipped = self.skipped, 0
+            return events, skipped
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+
+class EventBroadcaster:
+    """Fan-out hub: every subscriber gets every published event.
+
+    publish() never blocks on a client, a slow client only overruns its own ring.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._sinks = []   # other fan-outs with push(event), e.g. the async SSE server
+
+    def subscribe(self):
+        sub = SSESubscriber(SSE_CLIENT_BUFFER, SSE_MAX_SKIPPED_EVENTS)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        sub.close()
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def attach(self, sink):
+        with self._lock:
+            self._sinks.append(sink)
+
+    def publish(self, event):
+        with self._lock:
+            subs = tuple(self._subscribers)
+            sinks = tuple(self._sinks)
+        for sink in sinks:
+            sink.push(event)
+        for sub in subs:
+            sub.push(event)
+            if sub.closed:
+                print("[SSE] dropping slow client")
+                self.unsubscribe(sub)
+
+    def client_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+event_hub = EventBroadcaster()
+
+
+# ------------------ DATA VERSIONS ------------------
+# events and photos only grow by AUTOINCREMENT ids and shrink by retention (id < cutoff),
+# so [cutoff, newest id] names a table's rows the same way in every process: web workers
+# follow it from the ids on the channel and cached pages get the same ETag in all of them
+_versions_lock = threading.Lock()
+_data_versions = {"events": [0, 0], "photos": [0, 0]}   # table -> [below, newest id]
+
+# the rest of every ETag: code, templates and page settings, so a deploy never matches
+# an old one; set by create_app(), the same in all workers
+RENDER_ID = ""
+
+
+def bump_version(table, new_id=None, below=None):
+    """Move the table's version to a committed id and/or a retention cutoff."""
+    with _versions_lock:
+        version = _data_versions[table]
+        if new_id:
+            version[1] = max(version[1], new_id)
+        if below:
+            version[0] = max(version[0], below)
+
+
+def data_version(table):
+    with _versions_lock:
+        return "%d.%d" % tuple(_data_versions[table])
+
+
+def load_versions():
+    """Versions from the databases, at the start and when a web worker resyncs."""
+    for table, connect in (("events", get_events_db), ("photos", get_photos_db)):
+        conn = connect()
+        low, high = conn.execute("SELECT MIN(id), MAX(id) FROM " + table).fetchone()
+        conn.close()
+        bump_version(table, high, low)
+
+
+def render_id():
+    parts = [SSE_DASHBOARD_DIRECT, sse_server.port if sse_server else None]
+    templates = os.path.join(app.root_path, app.template_folder)
+    paths = [os.path.abspath(__file__)]
+    if os.path.isdir(templates):
+        paths += [os.path.join(templates, name) for name in sorted(os.listdir(templates))]
+    for path in paths:
+        parts.append((os.path.basename(path), os.stat(path).st_mtime_ns))
+    return "%08x" % zlib.crc32(repr(parts).encode("utf-8"))
+
+
+# ------------------ EVENTS CACHE ------------------
+def _event_key(e):
+    return (e.get("epoch") or 0, e.get("id") or 0)
+
+
+class RecentEventsCache:
+    """The newest events of events.db in memory, ordered by (epoch, id).
+
+    Filled from the DB at startup, then kept current by the insert path
+    (commit callback of submit_event) and by retention. Returned dicts are
+    shared between callers, treat them as read-only.
+    """
+
+    def __init__(self, capacity=EVENTS_CACHE_SIZE):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._items = deque()     # oldest -> newest
+        self._by_id = {}
+        self._evicted_max_id = 0  # highest id of a DB row that is not cached
+        self.exhaustive = False   # True while the cache holds every row of the table
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, events, uncached_max_id):
+        """events: the newest rows; uncached_max_id: highest id of the other rows, 0 if none."""
+        with self._lock:
+            self._items = deque(sorted(events, key=_event_key))
+            self._by_id = {e["id"]: e for e in self._items}
+            self._evicted_max_id = uncached_max_id
+            self.exhaustive = not uncached_max_id
+            self._trim()
+
+    def add(self, e):
+        """Insert or replace (same id) an event."""
+        if e.get("id") is None:
+            return
+        with self._lock:
+            old = self._by_id.get(e["id"])
+            if old is not None:
+                self._items.remove(old)
+            self._by_id[e["id"]] = e
+
+            key = _event_key(e)
+            if not self._items or _event_key(self._items[-1]) <= key:
+                self._items.append(e)
+            else:
+                # out of order epoch (clock step, late insert): search from the new end
+                i = len(self._items)
+                while i > 0 and _event_key(self._items[i - 1]) > key:
+                    i -= 1
+                self._items.insert(i, e)
+            self._trim()
+
+    def _trim(self):
+        while len(self._items) > self.capacity:
+            old = self._items.popleft()
+            del self._by_id[old["id"]]
+            self._evicted_max_id = max(self._evicted_max_id, old["id"])
+            self.exhaustive = False
+
+    def evict_below(self, cutoff_id):
+        """Rows with id < cutoff_id were deleted from the DB (retention)."""
+        with self._lock:
+            if cutoff_id > self._evicted_max_id:
+                self.exhaustive = True  # every uncached row is gone
+            if not any(i < cutoff_id for i in self._by_id):
+                return
+            self._items = deque(e for e in self._items if e["id"] >= cutoff_id)
+            self._by_id = {e["id"]: e for e in self._items}
+
+    def last(self, limit):
+        """Newest `limit` events, newest first, None if the cache can't answer."""
+        with self._lock:
+            if limit > len(self._items) and not self.exhaustive:
+                self.misses += 1
+                return None
+            self.hits += 1
+            n = min(limit, len(self._items))
+            return [self._items[-1 - i] for i in range(n)]
+
+    def after(self, last_id, limit):
+        """Events with id > last_id in id order, None if some may not be cached."""
+        with self._lock:
+            if last_id < self._evicted_max_id:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return sorted((e for e in self._items if e["id"] > last_id), key=lambda e: e["id"])[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "capacity": self.capacity,
+                "exhaustive": self.exhaustive,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+events_cache = RecentEventsCache()
+
 # ------------------ RGB LED ------------------
 rgb_led = None
 _led_lock = threading.Lock()
@@ -76,11 +551,14 @@ _led_timer = None
 def init_rgb_led(active_high=True):
     global rgb_led
     try:
+        from gpiozero import RGBLED
+
         rgb_led = RGBLED(
             red=RGB_RED_PIN,
             green=RGB_GREEN_PIN,
             blue=RGB_BLUE_PIN,
-            active_high=active_high
+            active_high=active_high,
+            pin_factory=GPIO_PIN_FACTORY
         )
         rgb_led.color = LED_IDLE_COLOR
         print("[LED] RGB ready (idle=blue)")
@@ -97,8 +575,10 @@ def _set_idle_blue():
         _led_timer = None
 
 
-def led_feedback(color, seconds=LED_FEEDBACK_SECONDS):
+def led_feedback(color, seconds=None):
     global _led_timer
+    if seconds is None:
+        seconds = LED_FEEDBACK_SECONDS
     with _led_lock:
         if not rgb_led:
             return
@@ -135,124 +615,519 @@ def led_set_idle_blue():
             rgb_led.color = LED_IDLE_COLOR
 
 
+# ------------------ DB: WRITER ------------------
+class DBWriter:
+    """Single thread owning the write connections of events.db and photos.db.
+
+    Write requests are queued as fn(cur, *args) and executed in batches, one
+    transaction (and one fsync) per database and batch. Each request gets its
+    own SAVEPOINT, so a failing request does not roll back the rest of the batch.
+    """
+
+    _STOP = object()
+
+    def __init__(self, paths, batch_max=DB_BATCH_MAX, batch_window=DB_BATCH_WINDOW_SECONDS):
+        self.paths = dict(paths)
+        self.batch_max = int(batch_max)
+        self.batch_window = float(batch_window)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._put_lock = threading.Lock()   # nothing is queued behind _STOP
+        self._stopped = False
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        if not self._thread or not self._thread.is_alive():
+            return
+        with self._put_lock:
+            self._stopped = True
+            self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def submit(self, db, fn, *args, on_commit=None) -> Future:
+        """Queue fn(cur, *args) on `db`; on_commit(result) runs after the commit."""
+        if db not in self.paths:
+            raise KeyError(db)
+        fut = Future()
+        with self._put_lock:
+            if self._stopped:
+                fut.set_exception(RuntimeError("DB writer stopped"))
+            else:
+                self._queue.put((db, fn, args, on_commit, fut))
+        return fut
+
+    def call(self, db, fn, *args, timeout=None):
+        return self.submit(db, fn, *args).result(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _connect(self, path):
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=" + DB_SYNCHRONOUS)
+        return conn
+
+    def _collect(self, first):
+        batch = [first]
+        if first is self._STOP:
+            return batch
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_max:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                # a lone write commits right away, the window only groups a burst that is under way
+                if len(batch) == 1:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(item)
+            if item is self._STOP:
+                break
+        return batch
+
+    def _run(self):
+        conns = {}
+        print("[DB] writer ready")
+        while True:
+            batch = self._collect(self._queue.get())
+            stop = batch[-1] is self._STOP
+            if stop:
+                batch.pop()
+
+            by_db = {}
+            for item in batch:
+                by_db.setdefault(item[0], []).append(item)
+
+            for db, items in by_db.items():
+                try:
+                    conn = conns.get(db)
+                    if conn is None:
+                        conn = conns[db] = self._connect(self.paths[db])
+                except Exception as e:
+                    for item in items:
+                        item[4].set_exception(e)
+                    continue
+                self._execute(conn, db, items)
+
+            if stop:
+                break
+
+        # only possible if _STOP was queued behind submit()'s back: fail, do not hang the callers
+        with self._put_lock:
+            self._stopped = True
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self._STOP:
+                item[4].set_exception(RuntimeError("DB writer stopped"))
+
+        for conn in conns.values():
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _execute(self, conn, db, items):
+        cur = conn.cursor()
+        results = []
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for _db, fn, args, _cb, _fut in items:
+                cur.execute("SAVEPOINT req")
+                try:
+                    results.append((True, fn(cur, *args)))
+                    cur.execute("RELEASE req")
+                except Exception as e:
+                    cur.execute("ROLLBACK TO req")
+                    cur.execute("RELEASE req")
+                    results.append((False, e))
+
+            cur.execute("COMMIT")
+        except Exception as e:
+            print("[DB] commit failed on", db + ":", e)
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            for item in items:
+                if not item[4].done():
+                    item[4].set_exception(e)
+            return
+
+        for (_db, _fn, _args, on_commit, fut), (ok, value) in zip(items, results):
+            if not ok:
+                fut.set_exception(value)
+                continue
+            if on_commit:
+                try:
+                    on_commit(value)
+                except Exception as e:
+                    print("[DB] on_commit failed:", e)
+            fut.set_result(value)
+
+
+db_writer = DBWriter({"events": EVENTS_DB, "photos": PHOTOS_DB, "credentials": CREDENTIALS_DB})
+atexit.register(db_writer.stop)
+
+photo_store = PhotoStore(PHOTO_DIR, renditions=PHOTO_RENDITIONS)
+
+
 # ------------------ DB: PHOTOS ------------------
 def get_photos_db():
     return sqlite3.connect(PHOTOS_DB)
 
 
 def init_photos_db():
-    conn = get_photos_db()
+    conn = sqlite3.connect(PHOTOS_DB, isolation_level=None)
     cur = conn.cursor()
 
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS photos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT,
-            image BLOB,
-            created_at TEXT,
-            mime TEXT
-        )
-    """)
-    conn.commit()
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='photos'")
+    if not cur.fetchone():
+        cur.execute(PHOTOS_TABLE_SQL.format(name="photos"))
+        cur.execute("PRAGMA user_version = " + str(PHOTOS_SCHEMA_VERSION))
+    else:
+        # If DB existed without mime column, try to add it
+        try:
+            cur.execute("ALTER TABLE photos ADD COLUMN mime TEXT")
+        except Exception:
+            pass
 
-    # If DB existed without mime column, try to add it
-    try:
-        cur.execute("ALTER TABLE photos ADD COLUMN mime TEXT")
-        conn.commit()
-    except Exception:
-        pass
+        # created_at_epoch is needed for age based retention (created_at is local time)
+        try:
+            cur.execute("ALTER TABLE photos ADD COLUMN created_at_epoch REAL")
+            cur.execute(
+                "UPDATE photos SET created_at_epoch = COALESCE(CAST(strftime('%s', created_at, 'utc') AS REAL), 0) "
+                "WHERE created_at_epoch IS NULL"
+            )
+        except Exception:
+            pass
+
+        # photos used to be stored as BLOBs, move them to the photo store
+        try:
+            export_blobs(conn, photo_store)
+        except Exception as e:
+            print("[PHOTOS] BLOB export failed:", e)
 
+    cur.execute("CREATE INDEX IF NOT EXISTS photos_path ON photos (path)")
     conn.close()
 
 
-def ensure_photo_dir():
-    os.makedirs(PHOTO_DIR, exist_ok=True)
+def trim_photos_db():
+    retention.run_pass("photos", force=True)
 
 
-def trim_photos_db(max_rows=MAX_PHOTOS):
-    conn = get_photos_db()
-    cur = conn.cursor()
+def _insert_photo(cur, filename, info, created_at):
+    # content that was stored already is not written again (commit_tmp), retention may have
+    # removed that file since: no row without a file. Both run in a write transaction.
+    if not os.path.exists(photo_store.abspath(info["path"])):
+        raise FileNotFoundError("photo file was removed meanwhile: " + info["path"])
+    cur.execute(
+        "INSERT INTO photos (filename, path, size, sha256, mime, width, height, created_at, created_at_epoch) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (filename, info["path"], info["size"], info["sha256"], info["mime"],
+         info["width"], info["height"], created_at, now_epoch())
+    )
+    retention.added("photos", info["size"])
+    return cur.lastrowid
 
-    cur.execute("SELECT COUNT(*) FROM photos")
-    count = cur.fetchone()[0] or 0
-    excess = count - int(max_rows)
 
-    if excess > 0:
-        cur.execute("SELECT id FROM photos ORDER BY id ASC LIMIT ?", (excess,))
-        ids = [r[0] for r in cur.fetchall()]
-        cur.executemany("DELETE FROM photos WHERE id = ?", [(i,) for i in ids])
-        conn.commit()
+def insert_photo_to_db(filename, info):
+    """Add metadata of a photo that is already in photo_store, returns the photo id."""
+    if not info:
+        return None
+    return insert_photos_to_db([(filename, info)])[0]
 
-    conn.close()
+
+def insert_photos_to_db(items):
+    """Insert many [(filename, info)] at once (one commit for the writer), returns the ids."""
+    t0 = time.perf_counter()
+
+    def committed(info):
+        def cb(_id):
+            db_insert_seconds.observe(time.perf_counter() - t0, "photos")
+            bump_version("photos", _id)
+            notify_changed("photos", id=_id, nbytes=info["size"])
+        return cb
+
+    futs = [
+        db_writer.submit("photos", _insert_photo, filename, info, now_ts(), on_commit=committed(info))
+        for filename, info in items
+    ]
+    return [f.result() for f in futs]
 
 
-def insert_photo_to_db(filename, image_bytes, mime="image/jpeg"):
-    if not image_bytes:
+# ------------------ THUMBNAILS ------------------
+_thumb_pool = None
+_thumb_lock = threading.Lock()
+_thumb_pending = {}   # rel path -> Future, so a photo is only rendered once at a time
+
+
+def init_thumb_pool():
+    global _thumb_pool
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("[THUMBS] Pillow not installed, serving originals")
         return
-    conn = get_photos_db()
-    cur = conn.cursor()
+
+    # create_app() may run with threads alive (first request, simulator), and forking those
+    # can leave a lock held in the child: workers come from a clean forkserver that only
+    # imports photostore, which is all make_renditions needs (like with spawn, a script
+    # that calls create_app() needs the `if __name__ == "__main__":` guard)
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(["photostore"])
+    _thumb_pool = ProcessPoolExecutor(max_workers=THUMB_WORKERS, mp_context=ctx)
+    _thumb_pool.submit(os.getpid).result()
+    print("[THUMBS] ready with", THUMB_WORKERS, "workers")
+
+
+def shutdown_thumb_pool():
+    """Stop the worker processes (they outlive an os._exit() of the app otherwise)."""
+    global _thumb_pool
+    if _thumb_pool is not None:
+        _thumb_pool.shutdown(wait=True, cancel_futures=True)
+        _thumb_pool = None
+
+
+def _thumb_done(rel, fut):
+    with _thumb_lock:
+        _thumb_pending.pop(rel, None)
+    if fut.cancelled():
+        return   # shutdown_thumb_pool() with renditions still queued
+    error = fut.exception()
+    if error:
+        print("[THUMBS] failed for", rel + ":", error)
+
+
+def submit_renditions(rel, mime="image/jpeg"):
+    """Queue missing thumbnails/previews of a stored photo, returns a Future or None."""
+    if _thumb_pool is None or not (mime or "").startswith("image/"):
+        return None
+    with _thumb_lock:
+        fut = _thumb_pending.get(rel)
+        if fut:
+            return fut
+        targets = photo_store.missing_renditions(rel)
+        if not targets:
+            return None
+        try:
+            fut = _thumb_pool.submit(make_renditions, photo_store.abspath(rel), targets)
+        except Exception as e:
+            print("[THUMBS] submit failed:", e)
+            return None
+        _thumb_pending[rel] = fut
+    fut.add_done_callback(lambda f: _thumb_done(rel, f))
+    return fut
+
+
+def _collect_orphan_files(cur, below):
+    # files of deleted rows that no remaining row points to (same content can be stored once for many rows)
     cur.execute(
-        "INSERT INTO photos (filename, image, created_at, mime) VALUES (?, ?, ?, ?)",
-        (filename, image_bytes, now_ts(), mime)
+        "SELECT DISTINCT p.path FROM photos p WHERE p.id < ? "
+        "AND NOT EXISTS (SELECT 1 FROM photos q WHERE q.path = p.path AND q.id >= ?)",
+        (below, below)
     )
-    conn.commit()
-    conn.close()
+    return [r[0] for r in cur.fetchall()]
 
-    try:
-        trim_photos_db(MAX_PHOTOS)
-    except Exception as e:
-        print("[PHOTOS] trim failed:", e)
+
+def _unlink_unreferenced(cur, paths):
+    # a row for the same content may have been inserted (by any process) since the collect query;
+    # the write transaction keeps new ones out until the files are gone
+    for rel in paths:
+        if cur.execute("SELECT 1 FROM photos WHERE path = ? LIMIT 1", (rel,)).fetchone() is None:
+            photo_store.remove(rel)
+
+
+def _remove_photo_files(paths):
+    db_writer.call("photos", _unlink_unreferenced, paths)
 
 
 # ------------------ DB: EVENTS ------------------
 def get_events_db():
-    # check_same_thread=False would be optional, but we always open new per call
+    # read connections are opened per call, all writes go through db_writer
     return sqlite3.connect(EVENTS_DB)
 
 
-def init_events_db():
-    conn = get_events_db()
+EVENTS_SCHEMA_VERSION = 2
+
+# typed columns are the source of truth, anything else goes to `extra` (compact JSON)
+EVENTS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        created_at_epoch REAL NOT NULL,
+        type TEXT,
+        status TEXT,
+        uid TEXT,
+        name TEXT,
+        photo TEXT,
+        event_id TEXT,
+        extra TEXT
+    )
+"""
+
+EVENT_COLUMNS = "id, created_at, created_at_epoch, type, status, uid, name, photo, event_id, extra"
+
+# event dict keys that map to typed columns
+EVENT_CORE_KEYS = frozenset(("id", "timestamp", "epoch", "type", "status", "uid", "name", "photo", "event_id"))
+
+
+def event_extra_json(e):
+    extra = {k: v for k, v in e.items() if k not in EVENT_CORE_KEYS}
+    if not extra:
+        return None
+    return json.dumps(extra, ensure_ascii=False, separators=(",", ":"))
+
+
+def row_to_event(row) -> dict:
+    """Build an event dict straight from an EVENT_COLUMNS cursor tuple."""
+    row_id, created_at, epoch, typ, status, uid, name, photo, event_id, extra = row
+    e = {
+        "type": typ or "UNKNOWN",
+        "timestamp": created_at,
+        "epoch": epoch,
+        "uid": uid,
+        "name": name,
+        "status": status,
+        "photo": photo,
+        "event_id": event_id or None,
+        "id": row_id,
+    }
+    if extra:
+        try:
+            for k, v in json.loads(extra).items():
+                e.setdefault(k, v)
+        except Exception:
+            pass
+    return e
+
+
+def migrate_events_db(conn):
+    """One-shot v1 -> v2 migration: drop the JSON payload column.
+
+    Typed columns are kept as they are, keys that only lived in the payload
+    move to `extra`. Ids (and Last-Event-ID of connected browsers) stay valid.
+    """
     cur = conn.cursor()
+    cur.execute("PRAGMA table_info(events)")
+    columns = {r[1] for r in cur.fetchall()}
+    if "payload" not in columns:
+        return False
 
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            created_at TEXT NOT NULL,
-            created_at_epoch REAL NOT NULL,
-            type TEXT,
-            status TEXT,
-            uid TEXT,
-            name TEXT,
-            photo TEXT,
-            event_id TEXT,
-            payload TEXT
+    print("[EVENTS] migrating events.db to schema v2")
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("DROP TABLE IF EXISTS events_v2")
+        cur.execute(EVENTS_TABLE_SQL.format(name="events_v2"))
+
+        read = conn.cursor()
+        read.execute(
+            "SELECT id, created_at, COALESCE(created_at_epoch, 0), type, status, uid, name, photo, event_id, payload "
+            "FROM events ORDER BY id ASC"
         )
-    """)
-    conn.commit()
+        while True:
+            rows = read.fetchmany(1000)
+            if not rows:
+                break
+            out = []
+            for row in rows:
+                try:
+                    payload = json.loads(row[9]) if row[9] else {}
+                except Exception:
+                    payload = {}
+                if not isinstance(payload, dict):
+                    payload = {}
+                out.append(tuple(row[:9]) + (event_extra_json(payload),))
+            cur.executemany(
+                "INSERT INTO events_v2 (" + EVENT_COLUMNS + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                out
+            )
+
+        # DROP TABLE takes the AUTOINCREMENT counter along: keep it, or ids of rows that
+        # were deleted before the migration come back
+        seq = cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+        cur.execute("DROP TABLE events")
+        cur.execute("ALTER TABLE events_v2 RENAME TO events")
+        if seq:
+            cur.execute("DELETE FROM sqlite_sequence WHERE name = 'events'")
+            cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('events', ?)", seq)
+        cur.execute("PRAGMA user_version = " + str(EVENTS_SCHEMA_VERSION))
+        cur.execute("COMMIT")
+    except Exception:
+        cur.execute("ROLLBACK")
+        raise
+    return True
+
+
+def init_events_db():
+    conn = sqlite3.connect(EVENTS_DB, isolation_level=None)
+    cur = conn.cursor()
+
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='events'")
+    if not cur.fetchone():
+        cur.execute(EVENTS_TABLE_SQL.format(name="events"))
+        cur.execute("PRAGMA user_version = " + str(EVENTS_SCHEMA_VERSION))
+        create_events_indexes(cur)
+        conn.close()
+        return
 
     # Migration: if table exists without epoch/event_id columns, try to add
     try:
         cur.execute("ALTER TABLE events ADD COLUMN created_at_epoch REAL")
-        conn.commit()
     except Exception:
         pass
 
     try:
         cur.execute("ALTER TABLE events ADD COLUMN event_id TEXT")
-        conn.commit()
     except Exception:
         pass
 
     # If epoch could be NULL (older DB), fill best-effort
     try:
         cur.execute("UPDATE events SET created_at_epoch = COALESCE(created_at_epoch, 0) WHERE created_at_epoch IS NULL")
-        conn.commit()
     except Exception:
         pass
 
+    try:
+        migrate_events_db(conn)
+    except Exception as e:
+        print("[EVENTS] migration failed:", e)
+
+    create_events_indexes(cur)
     conn.close()
 
 
+# every /api/events filter is an index range scan in (created_at_epoch, id) order
+# (SQLite appends the rowid to each index, so id is the tie-breaker for free)
+EVENTS_INDEXES = {
+    "events_epoch": "created_at_epoch",
+    "events_type_epoch": "type, created_at_epoch",
+    "events_status_epoch": "status, created_at_epoch",
+    "events_uid_epoch": "uid, created_at_epoch",
+    "events_event_id_epoch": "event_id, created_at_epoch",
+}
+
+
+def create_events_indexes(cur):
+    for name, columns in EVENTS_INDEXES.items():
+        cur.execute("CREATE INDEX IF NOT EXISTS " + name + " ON events (" + columns + ")")
+
+
 def normalize_event(entry: dict) -> dict:
     e = dict(entry) if isinstance(entry, dict) else {}
 
@@ -283,83 +1158,572 @@ def normalize_event(entry: dict) -> dict:
     return e
 
 
-def trim_events_db(max_rows=MAX_EVENTS):
-    conn = get_events_db()
-    cur = conn.cursor()
+def trim_events_db():
+    retention.run_pass("events", force=True)
 
-    cur.execute("SELECT COUNT(*) FROM events")
-    count = cur.fetchone()[0] or 0
-    excess = count - int(max_rows)
 
-    if excess > 0:
-        cur.execute("SELECT id FROM events ORDER BY id ASC LIMIT ?", (excess,))
-        ids = [r[0] for r in cur.fetchall()]
-        cur.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in ids])
-        conn.commit()
+# approximate row size, same formula as the retention bytes expression for events
+EVENT_BYTES_SQL = (
+    "16 + COALESCE(length(created_at),0) + COALESCE(length(type),0) + COALESCE(length(status),0)"
+    " + COALESCE(length(uid),0) + COALESCE(length(name),0) + COALESCE(length(photo),0)"
+    " + COALESCE(length(event_id),0) + COALESCE(length(extra),0)"
+)
+
+
+def _insert_event(cur, e):
+    row = (e.get("timestamp") or now_ts(), float(e.get("epoch") or now_epoch()), e.get("type"),
+           e.get("status"), e.get("uid"), e.get("name"), e.get("photo"), e.get("event_id"),
+           event_extra_json(e))
+    cur.execute(
+        "INSERT INTO events (created_at, created_at_epoch, type, status, uid, name, photo, event_id, extra) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        row
+    )
+    retention.added("events", 16 + sum(len(v) for v in row if isinstance(v, str)))
+    return cur.lastrowid
 
-    conn.close()
+
+def _submit_event(e, on_commit=None) -> Future:
+    t0 = time.monotonic()
+
+    def committed(new_id):
+        t1 = time.monotonic()
+        db_insert_seconds.observe(t1 - t0, "events")
+        tracer.span(e["event_id"], event_stage(e, "insert"), t0, t1)
+        e["id"] = new_id
+        events_cache.add(e)
+        bump_version("events", new_id)
+        if on_commit:
+            on_commit(e)
+
+    return db_writer.submit("events", _insert_event, e, on_commit=committed)
+
+
+def submit_event(entry, on_commit=None) -> Future:
+    """Queue an insert; on_commit(event) runs on the writer after the commit."""
+    return _submit_event(normalize_event(entry), on_commit)
 
 
 def insert_event_to_db(entry) -> int:
+    return submit_event(entry).result()
+
+
+def record_event(entry, wait=True) -> dict:
+    """Store an event and publish it to SSE clients once it is committed.
+
+    Publishing happens on the writer thread in commit order, so clients see
+    ascending ids. With wait=False the caller does not block on the commit.
+    """
     e = normalize_event(entry)
+    fut = _submit_event(e, on_commit=event_hub.publish)
+    if wait:
+        try:
+            fut.result()
+        except Exception as ex:
+            print("[EVENTS] insert failed:", ex)
+    return e
 
-    created_at = e.get("timestamp") or now_ts()
-    created_at_epoch = float(e.get("epoch") or now_epoch())
 
-    payload = json.dumps(e, ensure_ascii=False)
+def get_events_after(last_id, limit=None):
+    if limit is None:
+        limit = SSE_REPLAY_LIMIT
+    cached = events_cache.after(int(last_id), limit)
+    if cached is not None:
+        return cached
 
     conn = get_events_db()
     cur = conn.cursor()
+
     cur.execute(
-        """
-        INSERT INTO events (created_at, created_at_epoch, type, status, uid, name, photo, event_id, payload)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (created_at, created_at_epoch, e.get("type"), e.get("status"), e.get("uid"),
-         e.get("name"), e.get("photo"), e.get("event_id"), payload)
+        "SELECT " + EVENT_COLUMNS + " FROM events WHERE id > ? ORDER BY id ASC LIMIT ?",
+        (int(last_id), limit)
     )
-    conn.commit()
-    new_id = cur.lastrowid
+    rows = cur.fetchall()
+    conn.close()
 
-    # Update payload with final id
-    try:
-        e2 = dict(e)
-        e2["id"] = new_id
-        payload2 = json.dumps(e2, ensure_ascii=False)
-        cur.execute("UPDATE events SET payload=? WHERE id=?", (payload2, new_id))
-        conn.commit()
-    except Exception:
-        pass
+    return [row_to_event(r) for r in rows]
 
-    conn.close()
 
-    try:
-        trim_events_db(MAX_EVENTS)
-    except Exception as e:
-        print("[EVENTS] trim failed:", e)
+def replay_events(last_id):
+    """Every event after last_id, read in pages of SSE_REPLAY_LIMIT."""
+    while True:
+        page = get_events_after(last_id)
+        yield from page
+        if len(page) < SSE_REPLAY_LIMIT:
+            return
+        last_id = page[-1]["id"]
 
-    return new_id
 
+def encode_cursor(e):
+    return repr(float(e["epoch"])) + ":" + str(e["id"])
+
+
+def decode_cursor(value):
+    epoch, _, row_id = value.partition(":")
+    return float(epoch), int(row_id)
+
+
+# filter name -> SQL condition
+EVENT_FILTERS = {
+    "status": "status = ?",
+    "uid": "uid = ?",
+    "event_id": "event_id = ?",
+    "since": "created_at_epoch >= ?",
+    "until": "created_at_epoch < ?",
+}
+
+
+def query_events(filters=None, before=None, after=None, limit=None):
+    """One page of events, newest first, by keyset pagination.
+
+    before/after are (epoch, id) cursors: `before` pages to older events,
+    `after` to newer ones. Cost grows with `limit`, not with the table.
+    filters: type (list or comma separated), status, uid, event_id, since, until.
+    """
+    if limit is None:
+        limit = API_EVENTS_DEFAULT_LIMIT
+    where = []
+    params = []
+    for key, value in (filters or {}).items():
+        if value is None or value == "":
+            continue
+        if key == "type":
+            types = value if isinstance(value, (list, tuple)) else str(value).split(",")
+            where.append("type IN (" + ",".join("?" * len(types)) + ")")
+            params.extend(types)
+        elif key in EVENT_FILTERS:
+            where.append(EVENT_FILTERS[key])
+            params.append(value)
+        else:
+            raise ValueError("unknown filter: " + key)
+
+    order = "DESC"
+    if before is not None:
+        where.append("(created_at_epoch, id) < (?, ?)")
+        params.extend(before)
+    elif after is not None:
+        where.append("(created_at_epoch, id) > (?, ?)")
+        params.extend(after)
+        order = "ASC"
+
+    sql = "SELECT " + EVENT_COLUMNS + " FROM events"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at_epoch " + order + ", id " + order + " LIMIT ?"
+    params.append(int(limit))
 
-def get_last_events(limit=500):
     conn = get_events_db()
     cur = conn.cursor()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    conn.close()
+
+    out = [row_to_event(r) for r in rows]
+    if order == "ASC":
+        out.reverse()
+    return out
+
+
+def get_last_events(limit=500):
+    cached = events_cache.last(limit)
+    if cached is not None:
+        return cached
+    return query_events(limit=limit)
+
+
+def warm_events_cache():
+    events = query_events(limit=events_cache.capacity)
+    uncached_max_id = 0
+    if events:
+        conn = get_events_db()
+        uncached_max_id = conn.execute(
+            "SELECT MAX(id) FROM events WHERE (created_at_epoch, id) < (?, ?)",
+            (events[-1]["epoch"], events[-1]["id"])
+        ).fetchone()[0] or 0
+        conn.close()
+    events_cache.warm(events, uncached_max_id)
+
+
+# ------------------ DB: CREDENTIALS ------------------
+credentials = CredentialStore()
+
+
+def init_credentials_db():
+    conn = sqlite3.connect(CREDENTIALS_DB, isolation_level=None)
+    cur = conn.cursor()
+    cur.execute(CREDENTIALS_TABLE_SQL)
+    if not cur.execute("SELECT 1 FROM credentials LIMIT 1").fetchone():
+        now = now_epoch()
+        cur.executemany(
+            "INSERT INTO credentials (uid, label, enabled, updated_at) VALUES (?, ?, 1, ?)",
+            [(normalize_uid(uid), label, now) for uid, label in ALLOWED_UIDS.items()]
+        )
+        print("[CREDENTIALS] seeded", len(ALLOWED_UIDS), "cards")
+    snapshot = credentials.load(_read_credentials(cur))
+    conn.close()
+    print("[CREDENTIALS] loaded", len(snapshot), "cards")
+
+
+def _read_credentials(cur):
+    cur.execute("SELECT " + CREDENTIAL_COLUMNS + " FROM credentials")
+    return cur.fetchall()
+
 
+def _put_credential(cur, c):
     cur.execute(
-        "SELECT payload FROM events ORDER BY created_at_epoch DESC, id DESC LIMIT ?",
-        (limit,)
+        "INSERT INTO credentials (" + CREDENTIAL_COLUMNS + ") VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(uid) DO UPDATE SET label=excluded.label, enabled=excluded.enabled, "
+        "valid_from=excluded.valid_from, valid_until=excluded.valid_until, "
+        "schedule=excluded.schedule, updated_at=excluded.updated_at",
+        (c["uid"], c["label"], c["enabled"], c["valid_from"], c["valid_until"], c["schedule"], now_epoch())
     )
-    rows = cur.fetchall()
-    conn.close()
+    # the whole table from inside the same transaction, so snapshots follow the commit order
+    return _read_credentials(cur)
+
+
+def _delete_credential(cur, uid):
+    cur.execute("DELETE FROM credentials WHERE uid=?", (uid,))
+    return _read_credentials(cur) if cur.rowcount else None
+
+
+def change_credentials(fn, *args):
+    """Run a credentials write and swap in a new snapshot once it is committed."""
+    def committed(rows):
+        if rows is not None:
+            snapshot = credentials.load(rows)
+            print("[CREDENTIALS] snapshot", snapshot.version, "with", len(snapshot), "cards")
+            notify_changed("credentials")
+
+    return db_writer.submit("credentials", fn, *args, on_commit=committed).result() is not None
+
+
+def credential_to_json(c):
+    return {
+        "uid": c.uid,
+        "label": c.label,
+        "enabled": c.enabled,
+        "valid_from": c.valid_from,
+        "valid_until": c.valid_until,
+        "schedule": c.schedule,
+    }
+
+
+def _parse_epoch(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def credential_from_json(uid, data):
+    """Validated row values for _put_credential, raises ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError("JSON object expected")
+    uid = normalize_uid(uid)
+    label = str(data.get("label") or "").strip()
+    if not uid or not label:
+        raise ValueError("uid and label are required")
+    schedule = data.get("schedule") or None
+    parse_schedule(schedule)
+    c = {
+        "uid": uid,
+        "label": label,
+        "enabled": 1 if data.get("enabled", True) else 0,
+        "valid_from": _parse_epoch(data.get("valid_from")),
+        "valid_until": _parse_epoch(data.get("valid_until")),
+        "schedule": json.dumps(schedule) if schedule else None,
+    }
+    if c["valid_from"] and c["valid_until"] and c["valid_from"] >= c["valid_until"]:
+        raise ValueError("valid_from must be before valid_until")
+    return c
+
+
+# ------------------ RETENTION ------------------
+class RetentionPolicy:
+    """Limits for one table, None means unlimited."""
+
+    def __init__(self, max_rows=None, max_age_seconds=None, max_bytes=None, slack=RETENTION_SLACK):
+        self.max_rows = max_rows
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.slack = slack
+
+    def high_water(self, limit):
+        # hysteresis: trim once the table is `slack` over the limit, then back down to it
+        return limit + max(1, int(limit * self.slack))
+
+
+# table -> (policy, SQL expression for the size of one row in bytes)
+RETENTION_POLICIES = {
+    "events": (RetentionPolicy(max_rows=MAX_EVENTS), EVENT_BYTES_SQL),
+    "photos": (RetentionPolicy(max_rows=MAX_PHOTOS), "size"),
+}
 
-    out = []
-    for (payload,) in rows:
+
+class RetentionEngine:
+    """Keeps tables within their RetentionPolicy without work on the insert path.
+
+    Row and byte counters are updated incrementally by the insert functions
+    (on the writer thread). A background pass deletes the oldest rows in id
+    ranges (`id < cutoff`), in chunks that interleave with normal writes.
+    Table names double as db_writer database names.
+    """
+
+    def __init__(self, writer, policies):
+        self.writer = writer
+        self.policies = dict(policies)
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._bytes = {}
+        self._deleted = {}
+        self._synced_at = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._delete_hooks = {}
+
+    def on_delete(self, table, collect, cleanup):
+        """collect(cur, below) runs in the DELETE transaction, cleanup(result) after the commit."""
+        self._delete_hooks[table] = (collect, cleanup)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                t: {"rows": self._rows.get(t), "bytes": self._bytes.get(t), "deleted": self._deleted.get(t, 0)}
+                for t in self.policies
+            }
+
+    def added(self, table, nbytes=0):
+        """Called by the insert functions, O(1)."""
+        with self._lock:
+            if table not in self._rows:
+                return  # not synced yet, the first pass counts everything
+            self._rows[table] += 1
+            self._bytes[table] += nbytes
+            over = self._over_high_water(table)
+        if over:
+            self._wake.set()
+
+    def _over_high_water(self, table):
+        policy = self.policies[table][0]
+        if policy.max_rows is not None and self._rows[table] > policy.high_water(policy.max_rows):
+            return True
+        if policy.max_bytes is not None and self._bytes[table] > policy.high_water(policy.max_bytes):
+            return True
+        return False
+
+    def sync(self):
+        """Recount all tables (runs on the writer, so it is consistent with added())."""
+        for table, (_policy, bytes_sql) in self.policies.items():
+            self.writer.call(table, self._count, table, bytes_sql)
+        self._synced_at = time.monotonic()
+
+    def _count(self, cur, table, bytes_sql):
+        cur.execute("SELECT COUNT(*), COALESCE(SUM(" + bytes_sql + "), 0) FROM " + table)
+        rows, nbytes = cur.fetchone()
+        with self._lock:
+            self._rows[table] = rows
+            self._bytes[table] = nbytes
+
+    def run_pass(self, table, force=False):
+        """Trim one table. force=True trims down to the limits even below the high water mark."""
+        if table not in self._rows:
+            self.sync()
+        t0 = time.perf_counter()
+        cutoff = self.writer.call(table, self._find_cutoff, table, force)
+        if cutoff is None:
+            return 0
+        deleted = self._delete_below(table, cutoff)
+        db_trim_seconds.observe(time.perf_counter() - t0, table)
+        return deleted
+
+    def _find_cutoff(self, cur, table, force):
+        policy, bytes_sql = self.policies[table]
+        with self._lock:
+            rows = self._rows.get(table, 0)
+            nbytes = self._bytes.get(table, 0)
+        cutoffs = []
+
+        if policy.max_rows is not None:
+            limit = policy.max_rows if force else policy.high_water(policy.max_rows)
+            if rows > limit:
+                cur.execute(
+                    "SELECT id FROM " + table + " ORDER BY id ASC LIMIT 1 OFFSET ?",
+                    (rows - policy.max_rows,)
+                )
+                r = cur.fetchone()
+                if r:
+                    cutoffs.append(r[0])
+
+        if policy.max_age_seconds is not None:
+            oldest_allowed = now_epoch() - policy.max_age_seconds
+            cur.execute("SELECT created_at_epoch FROM " + table + " ORDER BY id ASC LIMIT 1")
+            r = cur.fetchone()
+            if r and r[0] is not None and r[0] < oldest_allowed:
+                cur.execute(
+                    "SELECT id FROM " + table + " WHERE created_at_epoch >= ? ORDER BY id ASC LIMIT 1",
+                    (oldest_allowed,)
+                )
+                r = cur.fetchone()
+                if r:
+                    cutoffs.append(r[0])
+                else:
+                    cur.execute("SELECT MAX(id) FROM " + table)
+                    cutoffs.append((cur.fetchone()[0] or 0) + 1)
+
+        if policy.max_bytes is not None:
+            limit = policy.max_bytes if force else policy.high_water(policy.max_bytes)
+            if nbytes > limit:
+                excess = nbytes - policy.max_bytes
+                cur.execute("SELECT id, " + bytes_sql + " FROM " + table + " ORDER BY id ASC")
+                acc = 0
+                for row_id, size in cur:
+                    acc += size or 0
+                    if acc >= excess:
+                        cutoffs.append(row_id + 1)
+                        break
+
+        return max(cutoffs) if cutoffs else None
+
+    def _delete_below(self, table, cutoff):
+        bytes_sql = self.policies[table][1]
+        lo = self.writer.call(table, lambda cur: cur.execute("SELECT MIN(id) FROM " + table).fetchone()[0])
+        if lo is None:
+            return 0
+
+        hooks = self._delete_hooks.get(table)
+        deleted = 0
+        while lo < cutoff:
+            lo = min(lo + RETENTION_DELETE_BATCH, cutoff)
+            n, collected = self.writer.call(table, self._delete_chunk, table, bytes_sql, lo)
+            deleted += n
+            if hooks and collected:
+                try:
+                    hooks[1](collected)
+                except Exception as e:
+                    print("[RETENTION]", table + ":", "cleanup failed:", e)
+        if deleted:
+            bump_version(table, below=cutoff)
+            notify_changed(table, below=cutoff)
+            print("[RETENTION]", table + ":", "deleted", deleted, "rows below id", cutoff)
+        return deleted
+
+    def _delete_chunk(self, cur, table, bytes_sql, below):
+        cur.execute("SELECT COUNT(*), COALESCE(SUM(" + bytes_sql + "), 0) FROM " + table + " WHERE id < ?", (below,))
+        n, nbytes = cur.fetchone()
+        collected = None
+        if n:
+            hooks = self._delete_hooks.get(table)
+            if hooks:
+                collected = hooks[0](cur, below)
+            cur.execute("DELETE FROM " + table + " WHERE id < ?", (below,))
+            with self._lock:
+                self._rows[table] -= n
+                self._bytes[table] -= nbytes
+                self._deleted[table] = self._deleted.get(table, 0) + n
+        return n, collected
+
+    def _run(self):
+        while True:
+            try:
+                if self._synced_at is None or time.monotonic() - self._synced_at > RETENTION_RESYNC_SECONDS:
+                    self.sync()
+                for table in self.policies:
+                    self.run_pass(table)
+            except Exception as e:
+                print("[RETENTION] pass failed:", e)
+            self._wake.wait(RETENTION_INTERVAL_SECONDS)
+            self._wake.clear()
+
+
+retention = RetentionEngine(db_writer, RETENTION_POLICIES)
+retention.on_delete("photos", _collect_orphan_files, _remove_photo_files)
+retention.on_delete("events", lambda cur, below: below, lambda below: evict_events_below(below))
+
+
+# ------------------ UPLOADS ------------------
+_upload_pool = ThreadPoolExecutor(UPLOAD_WORKERS, thread_name_prefix="upload")
+
+
+def _store_zip_member(zip_path, name):
+    """Unpack one zip member into the store (hashed while unpacking), None if it is no image."""
+    stream = HashingWriter(photo_store, max_bytes=UPLOAD_MAX_FILE_BYTES)
+    try:
+        with zipfile.ZipFile(zip_path) as zf, zf.open(name) as src:
+            stream.copy_from(src)
+        if not stream.image():
+            stream.discard()
+            return None
+        return stream.commit()
+    except BaseException:
+        stream.discard()
+        raise
+
+
+def _zip_image_names(zip_path):
+    names = []
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or info.file_size > UPLOAD_MAX_FILE_BYTES:
+                continue
+            names.append(info.filename)
+            if len(names) >= UPLOAD_ZIP_MAX_FILES:
+                break
+    return names
+
+
+def store_uploads(files):
+    """Store uploaded images and the images inside uploaded zips, returns the new photo ids.
+
+    Files were already streamed to disk and hashed while the request was
+    parsed. Zip members are unpacked in parallel, every photo is inserted with
+    one writer batch and its thumbnails go to the thumbnail pool.
+    """
+    images = []   # (filename, stream, mimetype)
+    zips = []     # (zip path, member names)
+    for f in files:
+        stream = f.stream
+        if not isinstance(stream, HashingWriter) or not stream.size:
+            continue
+        stream.flush()
+        if stream.image():
+            if stream.size > UPLOAD_MAX_FILE_BYTES:
+                print("[UPLOAD] too large:", f.filename, stream.size, "bytes")
+                continue
+            images.append((f.filename, stream, f.mimetype))
+        elif zipfile.is_zipfile(stream.path):
+            # raises BadZipFile for a broken archive, before anything went into the store
+            zips.append((stream.path, _zip_image_names(stream.path)))
+        else:
+            print("[UPLOAD] not an image:", f.filename)
+
+    stored = []   # (filename, info)
+    jobs = []     # (filename, Future)
+    for filename, stream, mimetype in images:
+        stored.append((filename, stream.commit(mimetype)))
+    for path, names in zips:
+        for name in names:
+            jobs.append((os.path.basename(name), _upload_pool.submit(_store_zip_member, path, name)))
+
+    for name, fut in jobs:
         try:
-            e = json.loads(payload) if payload else {}
-        except Exception:
-            e = {}
-        out.append(normalize_event(e))
-    return out
+            info = fut.result()
+        except Exception as e:   # FileTooLarge, broken/encrypted member, ...
+            print("[UPLOAD] skipped", name + ":", e)
+            continue
+        if info:
+            stored.append((name, info))
+
+    photo_ids = insert_photos_to_db(stored)
+    for _name, info in stored:
+        submit_renditions(info["path"], info["mime"])
+    return photo_ids
 
 
 # ------------------ GALLERY ------------------
@@ -373,14 +1737,16 @@ GALLERY_HTML = """
 <body>
 <h1>Foto hochladen</h1>
 <form method="post" enctype="multipart/form-data">
-  <input type="file" name="photo" required>
+  <input type="file" name="photo" accept="image/*,.zip" multiple required>
   <input type="submit" value="Upload">
 </form>
 
 <h2>Galerie</h2>
 {% for photo in photos %}
   <div style="display:inline-block;margin:6px;text-align:center;">
-    <img src="{{ url_for('get_photo', photo_id=photo[0]) }}" width="200"><br>
+    <a href="{{ url_for('get_photo', photo_id=photo[0]) }}" target="_blank">
+      <img src="{{ url_for('get_photo_rendition', photo_id=photo[0], kind='thumb') }}" width="200" loading="lazy">
+    </a><br>
     <small>{{ photo[1] }}</small>
   </div>
 {% endfor %}
@@ -392,42 +1758,174 @@ GALLERY_HTML = """
 @app.route("/gallery", methods=["GET", "POST"])
 def gallery():
     if request.method == "POST":
-        file = request.files.get("photo")
-        if file:
-            insert_photo_to_db(
-                filename=file.filename,
-                image_bytes=file.read(),
-                mime=(file.mimetype or "application/octet-stream")
-            )
+        try:
+            photo_ids = store_uploads(request.files.getlist("photo"))
+        except FileTooLarge as e:   # raised while the request body is streamed
+            print("[UPLOAD] too large:", e)
+            return ("Datei zu groß", 413)
+        except zipfile.BadZipFile as e:
+            print("[UPLOAD] broken zip:", e)
+            return ("Defekte ZIP-Datei", 400)
+        print("[UPLOAD]", len(photo_ids), "photos stored")
         return redirect(url_for("gallery"))
 
+    def render():
+        conn = get_photos_db()
+        cur = conn.cursor()
+        cur.execute("SELECT id, filename FROM photos ORDER BY id DESC")
+        photos = cur.fetchall()
+        conn.close()
+        return render_template_string(GALLERY_HTML, photos=photos)
+
+    return cached_page("gallery", "photos", render)
+
+
+def get_photo_row(photo_id):
     conn = get_photos_db()
     cur = conn.cursor()
-    cur.execute("SELECT id, filename FROM photos ORDER BY id DESC")
-    photos = cur.fetchall()
+    cur.execute("SELECT path, COALESCE(mime,'image/jpeg'), sha256 FROM photos WHERE id=?", (photo_id,))
+    row = cur.fetchone()
     conn.close()
-    return render_template_string(GALLERY_HTML, photos=photos)
+    return row
+
+
+def send_photo(path, mime, etag=None):
+    """send_file with 304/Range handling; content-hashed files are cached forever.
+
+    Without an etag (legacy files that are not content addressed) Flask's
+    mtime/size validator is used and the browser has to revalidate.
+    """
+    if not etag:
+        resp = send_file(path, mimetype=mime, conditional=True, max_age=0)
+        resp.cache_control.no_cache = True
+        return resp
+    resp = send_file(path, mimetype=mime, conditional=True, etag=etag, max_age=PHOTO_CACHE_SECONDS)
+    resp.cache_control.immutable = True
+    return resp
+
+
+def content_hash_etag(rel):
+    """"<sha256>[.kind]" of a store path ("ab/<sha256>[.kind].jpg"), None for other files."""
+    name = os.path.splitext(os.path.basename(rel))[0]
+    sha256 = name.split(".")[0]
+    if len(sha256) == 64 and all(c in "0123456789abcdef" for c in sha256):
+        return name
+    return None
 
 
 @app.route("/photo/<int:photo_id>")
 def get_photo(photo_id):
-    conn = get_photos_db()
-    cur = conn.cursor()
-    cur.execute("SELECT image, COALESCE(mime,'image/jpeg') FROM photos WHERE id=?", (photo_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = get_photo_row(photo_id)
+    if not row:
+        return ("Not found", 404)
+
+    rel, mime, sha256 = row
+    path = photo_store.abspath(rel)
+    if not os.path.exists(path):
+        return ("Not found", 404)
+    # served from disk (sendfile where the server supports it), never buffered
+    return send_photo(path, mime, sha256)
 
+
+@app.route("/photo/<int:photo_id>/<kind>")
+def get_photo_rendition(photo_id, kind):
+    if kind not in PHOTO_RENDITIONS:
+        return ("Not found", 404)
+    row = get_photo_row(photo_id)
     if not row:
         return ("Not found", 404)
 
-    image_bytes, mime = row
-    return send_file(io.BytesIO(image_bytes), mimetype=mime)
+    rel, mime, sha256 = row
+    path = photo_store.rendition_path(rel, kind)
+    if not os.path.exists(path):
+        # photos from before thumbnails existed are filled lazily
+        fut = submit_renditions(rel, mime)
+        if fut:
+            try:
+                fut.result(THUMB_WAIT_SECONDS)
+            except Exception:
+                pass
+    if os.path.exists(path):
+        return send_photo(path, "image/jpeg", sha256 + "." + kind)
+
+    # the original stands in, without long caching so the rendition is picked up later
+    path = photo_store.abspath(rel)
+    if not os.path.exists(path):
+        return ("Not found", 404)
+    return send_photo(path, mime)
+
+
+@app.route("/static/photos/<path:rel>")
+def get_static_photo(rel):
+    """Motion photo links (/static/photos/...), same caching as /photo/<id>."""
+    try:
+        path = photo_store.abspath(rel)
+    except ValueError:
+        return ("Not found", 404)
+    if not os.path.isfile(path):
+        return ("Not found", 404)
+    return send_photo(path, None, content_hash_etag(rel))
+
+
+@app.route("/stream.mjpg")
+def stream_mjpg():
+    global _stream_viewers
+    if not CAMERA_SOURCE or not capture_engine.is_live():
+        return ("Kamera nicht verfügbar", 503)
+    with _stream_lock:
+        if _stream_viewers >= STREAM_MAX_VIEWERS:
+            return ("Zu viele Zuschauer", 503)
+        _stream_viewers += 1
+    resp = Response(
+        mjpeg_stream(),
+        mimetype="multipart/x-mixed-replace; boundary=" + MJPEG_BOUNDARY,
+        headers={"Cache-Control": "no-cache, no-store", "X-Accel-Buffering": "no"}
+    )
+    resp.call_on_close(_release_stream_viewer)
+    return resp
+
+
+# ------------------ PAGE CACHE ------------------
+_page_lock = threading.Lock()
+_page_cache = {}   # page name -> (etag, rendered body)
+
+
+def cached_page(name, table, render):
+    """Serve a page rendered at most once per data version, with ETag/304.
+
+    A client that already has the current version gets a 304 without any DB
+    access or template rendering.
+    """
+    etag = name + "-" + RENDER_ID + "-" + data_version(table)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        with _page_lock:
+            hit = _page_cache.get(name)
+        if hit and hit[0] == etag:
+            body = hit[1]
+        else:
+            body = render().encode("utf-8")
+            with _page_lock:
+                _page_cache[name] = (etag, body)
+        resp = Response(body, mimetype="text/html")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
 
 
 @app.route("/")
 def home():
-    entries = get_last_events(limit=500)
-    return render_template("index.html", entries=entries)
+    def render():
+        entries = get_last_events(limit=500)
+        return render_template(
+            "index.html",
+            motion_entries=[e for e in entries if e["type"] in ("MOTION", "MOTION_PHOTO")],
+            rfid_entries=[e for e in entries if e["type"] == "RFID"],
+            sse_port=sse_server.port if sse_server and SSE_DASHBOARD_DIRECT else None
+        )
+
+    return cached_page("home", "events", render)
 
 
 @app.route("/debug/events")
@@ -435,168 +1933,802 @@ def debug_events():
     return jsonify(get_last_events(limit=20))
 
 
-@app.route("/events")
-def events():
-    def stream():
-        while True:
-            e = event_queue.get()
-            yield "data: " + json.dumps(e, ensure_ascii=False) + "\n\n"
-    return Response(stream(), mimetype="text/event-stream")
+@app.route("/api/events")
+def api_events():
+    args = request.args
+    try:
+        limit = min(max(int(args.get("limit", API_EVENTS_DEFAULT_LIMIT)), 1), API_EVENTS_MAX_LIMIT)
+        before = decode_cursor(args["before"]) if args.get("before") else None
+        after = decode_cursor(args["after"]) if args.get("after") else None
+        filters = {k: args.get(k) for k in ("type", "status", "uid", "event_id")}
+        for k in ("since", "until"):
+            if args.get(k):
+                filters[k] = float(args[k])
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid parameter"}), 400
+    if before and after:
+        return jsonify({"error": "use either before or after"}), 400
+
+    # one extra row tells whether there is another page
+    events = query_events(filters, before=before, after=after, limit=limit + 1)
+    has_more = len(events) > limit
+    if has_more:
+        events = events[1:] if after else events[:limit]
+
+    return jsonify({
+        "events": events,
+        "has_more": has_more,
+        "before": encode_cursor(events[-1]) if events else None,   # older page
+        "after": encode_cursor(events[0]) if events else None,     # newer page
+    })
+
+
+def admin_allowed():
+    # no loopback fallback: behind a reverse proxy every request comes from 127.0.0.1
+    if not ADMIN_TOKEN:
+        return False
+    given = request.headers.get("Authorization", "").encode("utf-8")
+    return hmac.compare_digest(given, ("Bearer " + ADMIN_TOKEN).encode("utf-8"))
+
+
+@app.route("/api/credentials")
+def api_credentials():
+    if not admin_allowed():
+        return jsonify({"error": "forbidden"}), 403
+    snapshot = credentials.current
+    cards = sorted(snapshot.cards.values(), key=lambda c: c.label.lower())
+    return jsonify({"version": snapshot.version, "credentials": [credential_to_json(c) for c in cards]})
+
+
+@app.route("/api/credentials/<uid>", methods=["GET", "PUT", "DELETE"])
+def api_credential(uid):
+    if not admin_allowed():
+        return jsonify({"error": "forbidden"}), 403
+    uid = normalize_uid(uid)
+
+    if request.method == "PUT":
+        try:
+            c = credential_from_json(uid, request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        change_credentials(_put_credential, c)
+    elif request.method == "DELETE":
+        if not change_credentials(_delete_credential, uid):
+            return jsonify({"error": "not found"}), 404
+        return "", 204
 
+    c = credentials.current.cards.get(uid)
+    if c is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(credential_to_json(c))
 
-def take_photo_fswebcam():
-    ensure_photo_dir()
-    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = ts + ".jpg"
-    full_path = os.path.join(PHOTO_DIR, filename)
-    rel_path = os.path.join("photos", filename)
 
-    cmd = [
-        "fswebcam",
-        "-q",
-        "-d", CAMERA_DEVICE,
-        "-r", PHOTO_RESOLUTION,
-        "--no-banner",
-        full_path
-    ]
-    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+@app.route("/debug/cache")
+def debug_cache():
+    return jsonify(events_cache.stats())
 
-    if not os.path.exists(full_path):
-        return None, None
 
-    try:
-        with open(full_path, "rb") as f:
-            image_bytes = f.read()
-    except Exception:
-        image_bytes = None
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
 
-    return rel_path.replace("\\", "/"), image_bytes
 
+@app.route("/debug/trace")
+def debug_traces():
+    return jsonify({"stages": tracer.summary(), "recent": tracer.recent()})
 
-def rfid_listener_forever():
-    while True:
-        try:
-            rfid_listener()
-        except Exception as e:
-            print("[RFID] crashed:", e)
-            time.sleep(2)
 
+@app.route("/debug/trace/<event_id>")
+def debug_trace(event_id):
+    trace = tracer.get(event_id)
+    if trace is None:
+        return jsonify({"error": "no trace for this event_id"}), 404
+    return jsonify(trace)
 
-def motion_listener_forever():
-    while True:
-        try:
-            motion_listener()
-        except Exception as e:
-            print("[MOTION] crashed:", e)
-            time.sleep(2)
 
+@app.route("/debug/sse")
+def debug_sse():
+    return jsonify({"flask_clients": event_hub.client_count(), "async": sse_server.stats() if sse_server else None})
 
-def rfid_listener():
-    ser = serial.Serial(SERIAL_PORT, BAUDRATE, timeout=1)
-    print("[RFID] ready on", SERIAL_PORT)
 
-    while True:
-        line = ser.readline().decode("utf-8", errors="ignore").strip()
-        if not line or not line.startswith("UID:"):
-            continue
+@app.route("/debug/channel")
+def debug_channel():
+    return jsonify({"role": ROLE, "channel": channel.stats() if channel else None})
 
-        uid = line.replace("UID:", "").strip()
-
-        if uid in ALLOWED_UIDS:
-            entry = {
-                "type": "RFID",
-                "timestamp": now_ts(),
-                "epoch": now_epoch(),
-                "uid": uid,
-                "name": ALLOWED_UIDS[uid],
-                "status": "AUTH",
-                "photo": None,
-                "event_id": None
-            }
-            led_feedback("GREEN")
-            ser.write(b"AUTH\n")
-        else:
-            entry = {
-                "type": "RFID",
-                "timestamp": now_ts(),
-                "epoch": now_epoch(),
-                "uid": uid,
-                "name": "Unbekannt",
-                "status": "DENY",
-                "photo": None,
-                "event_id": None
-            }
-            led_feedback("RED")
-            ser.write(b"DENY\n")
 
-        entry = normalize_event(entry)
-        entry["id"] = insert_event_to_db(entry)
-        event_queue.put(entry)
+@app.route("/debug/zones")
+def debug_zones():
+    return jsonify(motion_zones.stats())
 
 
-def motion_listener():
-    pir = MotionSensor(PIR_PIN)
-    print("[MOTION] ready on GPIO", PIR_PIN)
+@app.route("/debug/readers")
+def debug_readers():
+    return jsonify(rfid_readers.stats())
 
-    last = 0.0
 
-    def photo_worker(base_event):
-        led_set_white()
+@app.route("/debug/capture")
+def debug_capture():
+    return jsonify({"queue": capture_pool.stats(), "engine": capture_engine.stats()})
+
+
+def format_sse(e):
+    msg = "data: " + json.dumps(e, ensure_ascii=False) + "\n\n"
+    if e.get("id") is not None:
+        msg = "id: " + str(e["id"]) + "\n" + msg
+    return msg
+
+
+def sse_delivered(e):
+    """A live event was written to a client (Flask stream or async server)."""
+    sse_lag_seconds.observe(max(0.0, time.time() - float(e.get("epoch") or time.time())))
+    tracer.after(e.get("event_id"), event_stage(e, "sse"), event_stage(e, "insert"))
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@app.route("/events")
+def events():
+    # browsers send Last-Event-ID on reconnect, replay the gap from events.db
+    last_id = parse_last_event_id(
+        request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    )
+
+    def stream():
+        nonlocal last_id
+        # subscribe before replaying so nothing falls between replay and live; here and not
+        # in events(), a response that is never iterated (HEAD, early disconnect) leaves nothing
+        sub = event_hub.subscribe()
         try:
-            rel_path, img_bytes = take_photo_fswebcam()
+            yield "retry: " + str(SSE_RETRY_MS) + "\n\n"
+
+            if last_id is not None:
+                for e in replay_events(last_id):
+                    yield format_sse(e)
+                    last_id = e["id"]
+
+            while not sub.closed:
+                batch, skipped = sub.drain(SSE_HEARTBEAT_SECONDS)
+                if skipped and last_id is not None:
+                    # ring overran: fill the gap from events.db first
+                    for e in replay_events(last_id):
+                        yield format_sse(e)
+                        last_id = e["id"]
+
+                if not batch:
+                    yield ": keepalive\n\n"
+                    continue
+
+                for e in batch:
+                    eid = e.get("id")
+                    if eid is not None and last_id is not None and eid <= last_id:
+                        continue  # already sent by a replay
+                    yield format_sse(e)
+                    sse_delivered(e)
+                    if eid is not None:
+                        last_id = eid
         finally:
-            led_set_idle_blue()
+            event_hub.unsubscribe(sub)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def make_frame_source():
+    if FRAME_SOURCE:
+        return FRAME_SOURCE()
+    if CAMERA_SOURCE == "synthetic":
+        return SyntheticFrameSource(resolution=PHOTO_RESOLUTION, fps=CAMERA_FPS)
+    return FfmpegMjpegSource(
+        device=CAMERA_DEVICE, resolution=PHOTO_RESOLUTION, fps=CAMERA_FPS, input_format=CAMERA_INPUT_FORMAT
+    )
+
+
+capture_engine = CaptureEngine(make_frame_source, ring_size=CAPTURE_RING_FRAMES)
+
 
-        if img_bytes:
-            db_filename = "motion_" + datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".jpg"
-            insert_photo_to_db(db_filename, img_bytes, mime="image/jpeg")
+def take_photo(trigger_ts=None):
+    """Motion photo: frame closest to the trigger from the capture engine, fswebcam as fallback.
 
-        upd = dict(base_event)
-        upd["type"] = "MOTION_PHOTO"
-        upd["photo"] = rel_path
+    trigger_ts is a time.monotonic() value, returns (static rel path, info) or (None, None).
+    """
+    if CAMERA_SOURCE and capture_engine.is_live():
+        if trigger_ts is None:
+            trigger_ts = time.monotonic()
+        frame = capture_engine.frame_at(trigger_ts - CAPTURE_PRE_TRIGGER_SECONDS, CAPTURE_MAX_WAIT_SECONDS)
+        if frame:
+            info = photo_store.put_bytes(frame.data, mime="image/jpeg")
+            return "photos/" + info["path"], info
+    if not HARDWARE:
+        return None, None
+    return take_photo_fswebcam()
+
+
+def take_photos(trigger_ts=None):
+    """Burst capture: the BURST_KEEP sharpest of BURST_FRAMES frames, best first.
+
+    Returns [(static rel path, info)], empty if nothing could be captured.
+    Falls back to a single take_photo() without the capture engine.
+    """
+    if not (CAMERA_SOURCE and capture_engine.is_live() and BURST_FRAMES > 1):
+        rel_path, info = take_photo(trigger_ts)
+        return [(rel_path, info)] if info else []
+
+    if trigger_ts is None:
+        trigger_ts = time.monotonic()
+    frames = capture_engine.burst(trigger_ts - CAPTURE_PRE_TRIGGER_SECONDS, BURST_FRAMES, CAPTURE_MAX_WAIT_SECONDS)
+    best = select_sharpest(frames, BURST_KEEP, BURST_SCORE_BUDGET_SECONDS, BURST_SCORE_MAX_SIDE)
+
+    out = []
+    for _score, frame in best:
+        info = photo_store.put_bytes(frame.data, mime="image/jpeg")
+        out.append(("photos/" + info["path"], info))
+    return out
+
+
+_stream_lock = threading.Lock()
+_stream_viewers = 0
+
+MJPEG_BOUNDARY = "frame"
 
-        upd["timestamp"] = now_ts()
-        upd["epoch"] = now_epoch()
 
-        upd = normalize_event(upd)
-        upd["id"] = insert_event_to_db(upd)
-        event_queue.put(upd)
+def mjpeg_stream():
+    """multipart/x-mixed-replace body: always the newest frame, slow viewers skip frames.
 
+    Every viewer yields the same encoded bytes object the engine stored,
+    nothing is encoded or copied per viewer.
+    """
+    min_interval = 1.0 / STREAM_MAX_FPS if STREAM_MAX_FPS else 0.0
+    seq = 0
+    last_sent = 0.0
     while True:
-        pir.wait_for_motion()
-        now = time.time()
-        if now - last < MOTION_COOLDOWN_SECONDS:
-            continue
-        last = now
+        frame = capture_engine.wait_latest(seq, STREAM_FRAME_TIMEOUT_SECONDS)
+        if frame is None:
+            break
+        wait = last_sent + min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+            frame = capture_engine.latest() or frame
+        seq = frame.seq
+        last_sent = time.monotonic()
+        yield (
+            "--" + MJPEG_BOUNDARY + "\r\nContent-Type: image/jpeg\r\nContent-Length: "
+            + str(len(frame.data)) + "\r\n\r\n"
+        ).encode()
+        yield frame.data
+        yield b"\r\n"
+
+
+def _release_stream_viewer():
+    global _stream_viewers
+    with _stream_lock:
+        _stream_viewers -= 1
+
+
+def take_photo_fswebcam():
+    """Capture one still into photo_store, returns (static rel path, info) or (None, None)."""
+    tmp = photo_store.tmp_path(".jpg")
+
+    cmd = [
+        "fswebcam",
+        "-q",
+        "-d", CAMERA_DEVICE,
+        "-r", PHOTO_RESOLUTION,
+        "--no-banner",
+        tmp
+    ]
+    try:
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        print("[CAMERA] fswebcam failed:", e)
+        os.remove(tmp)
+        return None, None
+
+    if not os.path.exists(tmp):
+        return None, None
+    if os.path.getsize(tmp) == 0:
+        os.remove(tmp)
+        return None, None
+
+    info = photo_store.put_file(tmp, mime="image/jpeg")
+    return "photos/" + info["path"], info
+
+
+# ------------------ CAPTURE QUEUE ------------------
+class CaptureJob:
+    def __init__(self, key, event_id, trigger_ts):
+        self.key = key
+        self.event_id = event_id
+        self.trigger_ts = trigger_ts
+        self.queued_at = time.monotonic()
+        self.triggers = 1
+        self.unrecorded = 1   # MOTION events not stored yet, MOTION_PHOTO waits for them
+        self.sealed = False   # capture done, later triggers start a new job
+
+
+class CaptureExecutor:
+    """Fixed number of capture threads with a bounded job queue.
+
+    A trigger that arrives while a job for the same camera (key) is queued
+    or capturing is coalesced into it: the caller reuses job.event_id for
+    its MOTION event, so all of them link to the one MOTION_PHOTO. The
+    caller reports recorded() after storing it, so MOTION_PHOTO is never
+    published before the MOTION events it belongs to.
+    """
+
+    def __init__(self, run_job, workers=CAPTURE_WORKERS, queue_size=CAPTURE_QUEUE_SIZE, coalesce=CAPTURE_COALESCE):
+        self.run_job = run_job
+        self.workers = workers
+        self.queue_size = queue_size
+        self.coalesce = coalesce
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._open = {}          # key -> job still accepting triggers
+        self._threads = []
+        self.in_flight = 0
+        self.submitted = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name="capture-worker-%d" % i, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def trigger(self, key, event_id, trigger_ts):
+        """Returns (job, coalesced); job is None if the trigger was dropped."""
+        with self._cond:
+            job = self._open.get(key) if self.coalesce else None
+            if job and not job.sealed:
+                job.triggers += 1
+                job.unrecorded += 1
+                self.coalesced += 1
+                return job, True
+            if len(self._queue) >= self.queue_size:
+                self.dropped += 1
+                return None, False
+            job = CaptureJob(key, event_id, trigger_ts)
+            self._open[key] = job
+            self._queue.append(job)
+            self.submitted += 1
+            self._cond.notify()
+            return job, False
+
+    def recorded(self, job):
+        with self._cond:
+            job.unrecorded -= 1
+            self._cond.notify_all()
+
+    def wait_recorded(self, job, timeout=5.0):
+        with self._cond:
+            self._cond.wait_for(lambda: job.unrecorded <= 0, timeout)
+
+    def seal(self, job):
+        """Called by run_job once the photo is taken."""
+        with self._cond:
+            job.sealed = True
+            if self._open.get(job.key) is job:
+                del self._open[job.key]
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._queue),
+                "queue_size": self.queue_size,
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = self._queue.popleft()
+                self.in_flight += 1
+            ok = False
+            try:
+                self.run_job(job)
+                ok = True
+            except Exception as e:
+                print("[CAPTURE] job failed:", e)
+            finally:
+                self.seal(job)
+                with self._cond:
+                    self.in_flight -= 1
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+
+def run_capture_job(job):
+    t_start = time.monotonic()
+    tracer.span(job.event_id, "capture_queue", job.queued_at, t_start)
+    led_set_white()
+    method = "engine" if CAMERA_SOURCE and capture_engine.is_live() else "fswebcam"
+    try:
+        with capture_seconds.time(method):
+            photos = take_photos(job.trigger_ts)
+    finally:
+        led_set_idle_blue()
+        capture_pool.seal(job)
+    t_captured = time.monotonic()
+    tracer.span(job.event_id, "capture", t_start, t_captured)
+
+    photo_ids = []
+    for rel_path, info in photos:
+        db_filename = "motion_" + datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".jpg"
+        photo_ids.append(insert_photo_to_db(db_filename, info))
+        submit_renditions(info["path"], info["mime"])
+    if photo_ids:
+        tracer.span(job.event_id, "photo_insert", t_captured)
+
+    upd = {
+        "type": "MOTION_PHOTO",
+        "timestamp": now_ts(),
+        "epoch": now_epoch(),
+        "status": "DETECTED",
+        "photo": photos[0][0] if photos else None,
+        "photo_id": photo_ids[0] if photo_ids else None,
+        "uid": None,
+        "name": None,
+        "event_id": job.event_id
+    }
+    if len(photo_ids) > 1:
+        upd["burst_photo_ids"] = photo_ids
+    capture_pool.wait_recorded(job)
+    if job.triggers > 1:
+        upd["triggers"] = job.triggers
+
+    record_event(upd)
+
+
+capture_pool = CaptureExecutor(run_capture_job)
+
+
+def handle_rfid_line(door, line):
+    """One line from the Arduino at `door`, returns the reply for it (or None)."""
+    if not line.startswith("UID:"):
+        return None
+
+    uid = line.replace("UID:", "").strip()
+
+    now = now_epoch()
+    # one dict lookup in the current snapshot, no DB access on this path
+    status, name, reason = credentials.current.decide(uid, now)
+    entry = {
+        "type": "RFID",
+        "timestamp": now_ts(),
+        "epoch": now,
+        "uid": uid,
+        "name": name,
+        "status": status,
+        "door": door,
+        "photo": None,
+        "event_id": None
+    }
+    if reason and reason != "unknown":
+        entry["reason"] = reason
+
+    rfid_decisions.inc(door, status)
+    led_feedback("GREEN" if status == "AUTH" else "RED")
+    record_event(entry, wait=False)
+    # written by the reader loop right away, before anything else on this port
+    return b"AUTH\n" if status == "AUTH" else b"DENY\n"
+
+
+rfid_readers = None   # ReaderLoop, created by create_app()
+
+
+def handle_motion(zone, trigger_ts):
+    """Accepted PIR edge of a zone (cooldown already applied), trigger_ts is time.monotonic()."""
+    motion_triggers.inc(zone.name)
+    now = now_epoch()
+
+    # event_id links MOTION <-> MOTION_PHOTO, coalesced triggers share the running capture's id
+    # the zone is part of it, zones firing in the same millisecond must not share a trace
+    # the trace starts before the capture is queued, its worker adds spans right away
+    eid = f"motion-{zone.name}-{int(now*1000)}"
+    tracer.start(eid, trigger_ts)
+    tracer.span(eid, "dispatch", trigger_ts)
+    job = None
+    if zone.camera:
+        job, coalesced = capture_pool.trigger(zone.camera, eid, trigger_ts)
+        if coalesced:
+            # joins the running capture and its trace
+            tracer.drop(eid)
+            eid = job.event_id
+
+    # the writer stores events in submit order, so MOTION is in before MOTION_PHOTO
+    # without blocking the dispatcher on the commit
+    record_event({
+        "type": "MOTION",
+        "timestamp": now_ts(),
+        "epoch": now,
+        "status": "DETECTED",
+        "zone": zone.name,
+        "photo": None,
+        "uid": None,
+        "name": None,
+        "event_id": eid
+    }, wait=False)
+    if job:
+        capture_pool.recorded(job)
+
+
+motion_zones = None   # ZoneEngine, created by create_app()
+sse_server = None     # AsyncSSEServer, created by create_app() if SSE_ASYNC_PORT is set
+
+
+# ------------------ SENSOR CHANNEL ------------------
+# ROLE "sensor" runs a Hub, every web worker a Link. The sensor process publishes
+# committed events, cache evictions and photo changes; workers report their own writes
+# (uploads, credentials) so the sensor process and the other workers follow them.
+channel = None   # Hub (sensor) or Link (web), None in a single process
+
+
+class ChannelSink:
+    """EventBroadcaster sink of the sensor process: published events go to all web workers."""
+
+    def push(self, event):
+        channel.send({"kind": "event", "event": event})
+
+
+def notify_changed(table, **info):
+    if channel:
+        channel.send(dict(info, kind="changed", table=table))
 
-        # event_id links MOTION <-> MOTION_PHOTO
-        eid = f"motion-{int(now*1000)}"
 
-        base = normalize_event({
-            "type": "MOTION",
-            "timestamp": now_ts(),
-            "epoch": now_epoch(),
-            "status": "DETECTED",
-            "photo": None,
-            "uid": None,
-            "name": None,
-            "event_id": eid
-        })
+def evict_events_below(below):
+    events_cache.evict_below(below)
+    if channel and ROLE == "sensor":
+        channel.send({"kind": "evict", "below": below})
+
+
+def reload_credentials():
+    conn = sqlite3.connect(CREDENTIALS_DB)
+    snapshot = credentials.load(_read_credentials(conn.cursor()))
+    conn.close()
+    return snapshot
 
-        base["id"] = insert_event_to_db(base)
-        event_queue.put(base)
 
-        threading.Thread(target=photo_worker, args=(base,), daemon=True).start()
-        pir.wait_for_no_motion()
+def apply_changed(msg):
+    table = msg.get("table")
+    if table == "credentials":
+        reload_credentials()
+    elif table in ("events", "photos"):
+        bump_version(table, msg.get("id"), msg.get("below"))
 
 
-init_photos_db()
-init_events_db()
-init_rgb_led(active_high=True)
+def on_worker_message(msg, conn):
+    """Sensor process: a web worker committed a write."""
+    if msg.get("kind") != "changed":
+        return
+    if msg.get("table") == "photos" and msg.get("nbytes") is not None:
+        retention.added("photos", msg["nbytes"])
+    apply_changed(msg)
+    channel.send(msg, exclude=conn)
+
+
+def on_sensor_message(msg):
+    """Web worker: from the sensor process (and other workers through it)."""
+    kind = msg.get("kind")
+    if kind == "event":
+        e = msg["event"]
+        events_cache.add(e)
+        bump_version("events", e.get("id"))
+        event_hub.publish(e)
+    elif kind == "evict":
+        events_cache.evict_below(msg["below"])
+        bump_version("events", below=msg["below"])
+    elif kind == "changed":
+        apply_changed(msg)
+
+
+def resync_from_db():
+    """Web worker (re)connected: what was published in between is only in the databases."""
+    warm_events_cache()
+    reload_credentials()
+    load_versions()
+
+
+# ------------------ APP FACTORY ------------------
+# importing app.py only defines things: no DB file, thread, GPIO pin or serial port
+# is touched before create_app()
+_started = False
+_start_lock = threading.Lock()
+
+
+def configure(config):
+    """Override module settings (the upper case names above) before the start."""
+    g = globals()
+    for key, value in config.items():
+        if not key.isupper() or key not in g:
+            raise KeyError("unknown setting: " + key)
+        g[key] = value
+
+    # --data-dir / PI_SPACE_DATA_DIR may name a directory that does not exist yet
+    os.makedirs(DATA_DIR, exist_ok=True)
+    if "DATA_DIR" in config:
+        # paths below DATA_DIR follow it unless they are set explicitly
+        for key, name in (("PHOTOS_DB", "photos.db"), ("EVENTS_DB", "events.db"),
+                          ("CREDENTIALS_DB", "credentials.db"), ("PHOTO_DIR", os.path.join("static", "photos")),
+                          ("CHANNEL_SOCKET", "sensor.sock")):
+            if key not in config:
+                g[key] = os.path.join(DATA_DIR, name)
+    if "RFID_READERS" not in config:
+        g["RFID_READERS"] = default_rfid_readers()
+    if "MOTION_ZONES" not in config:
+        g["MOTION_ZONES"] = default_motion_zones()
+
+    # the objects below were built at import from the defaults, none of them has started yet.
+    # db_writer is updated in place: retention and atexit hold on to it
+    app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES
+    db_writer.paths.update(events=EVENTS_DB, photos=PHOTOS_DB, credentials=CREDENTIALS_DB)
+    db_writer.batch_max = int(DB_BATCH_MAX)
+    db_writer.batch_window = float(DB_BATCH_WINDOW_SECONDS)
+    g["photo_store"] = PhotoStore(PHOTO_DIR, renditions=PHOTO_RENDITIONS)
+    g["events_cache"] = RecentEventsCache(EVENTS_CACHE_SIZE)
+    g["tracer"] = Tracer(TRACE_MAX_EVENTS, TRACE_WINDOW, on_span=tracer.on_span)
+    g["capture_engine"] = CaptureEngine(make_frame_source, ring_size=CAPTURE_RING_FRAMES)
+    g["capture_pool"] = CaptureExecutor(run_capture_job, CAPTURE_WORKERS, CAPTURE_QUEUE_SIZE, CAPTURE_COALESCE)
+    g["_upload_pool"] = ThreadPoolExecutor(UPLOAD_WORKERS, thread_name_prefix="upload")
+    for policy, _size in RETENTION_POLICIES.values():
+        policy.slack = RETENTION_SLACK
+    RETENTION_POLICIES["events"][0].max_rows = MAX_EVENTS
+    RETENTION_POLICIES["photos"][0].max_rows = MAX_PHOTOS
+    if ROLE not in ROLES:
+        raise ValueError("ROLE must be one of " + ", ".join(ROLES))
+
+
+def start_sse_server():
+    global sse_server
+    server = AsyncSSEServer(
+        get_events_after, format_sse, replay_limit=SSE_REPLAY_LIMIT, port=SSE_ASYNC_PORT,
+        heartbeat=SSE_HEARTBEAT_SECONDS, retry_ms=SSE_RETRY_MS,
+        client_buffer=SSE_CLIENT_BUFFER, max_skipped=SSE_MAX_SKIPPED_EVENTS, max_clients=SSE_ASYNC_MAX_CLIENTS,
+        write_timeout=SSE_WRITE_TIMEOUT_SECONDS, on_delivered=sse_delivered, allow_origin=SSE_ASYNC_ALLOW_ORIGIN,
+        reuse_port=(ROLE == "web")   # all web workers accept on the same port
+    )
+    # port taken: the dashboard falls back to Flask's /events
+    if server.start():
+        event_hub.attach(server)
+        sse_server = server
+
+
+def start_services():
+    global rfid_readers, motion_zones, channel, RENDER_ID
+    init_photos_db()
+    init_events_db()
+    init_credentials_db()
+    warm_events_cache()
+    load_versions()
+    init_thumb_pool()
+    atexit.register(shutdown_thumb_pool)
+    # a web worker writes uploads and credentials itself, SQLite serializes the processes
+    db_writer.start()
+    if ROLE != "web":
+        retention.start()
+        capture_pool.start()
+    if ROLE == "sensor":
+        channel = Hub(CHANNEL_SOCKET, on_worker_message, max_buffer=CHANNEL_MAX_BUFFER).start()
+        event_hub.attach(ChannelSink())
+    elif ROLE == "web":
+        channel = Link(CHANNEL_SOCKET, on_sensor_message, on_connect=resync_from_db).start()
+    if SSE_ASYNC_PORT and ROLE != "sensor":
+        start_sse_server()
+    RENDER_ID = render_id()
+
+    hardware = HARDWARE and ROLE != "web"
+    rfid_readers = ReaderLoop(
+        RFID_READERS if hardware else {}, handle_rfid_line, baudrate=BAUDRATE,
+        opener=SERIAL_OPENER or open_serial,
+        reconnect_seconds=RFID_RECONNECT_SECONDS, max_reconnect_seconds=RFID_MAX_RECONNECT_SECONDS,
+        on_reply=lambda door, seconds: rfid_reply_seconds.observe(seconds, door)
+    )
+    motion_zones = ZoneEngine(
+        [Zone(z["zone"], z["pin"], z.get("cooldown", MOTION_COOLDOWN_SECONDS), z.get("camera"))
+         for z in (MOTION_ZONES if hardware else [])],
+        handle_motion, pin_factory=GPIO_PIN_FACTORY
+    )
+    if hardware:
+        init_rgb_led(active_high=True)
+        if CAMERA_SOURCE:
+            capture_engine.start()
+    else:
+        print("[APP] hardware disabled")
+    rfid_readers.start()
+    motion_zones.start()
+
+
+def create_app(config=None):
+    """Configure, create the databases and start the background services, returns the Flask app.
+
+    Runs once per process, later calls return the same app. WSGI servers
+    load "app:create_app()". Servers that import the bare `app` (`flask run`,
+    "gunicorn app:app") get it started with the default settings by the
+    first request, see _start_on_first_request().
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            if config:
+                raise RuntimeError("create_app() already ran, config can not change anymore")
+            return app
+        t0 = time.perf_counter()
+        configure(config or {})
+        start_services()
+        _started = True
+        print("[APP]", ROLE, "started in %.0f ms" % ((time.perf_counter() - t0) * 1000))
+    return app
+
+
+@app.before_request
+def _start_on_first_request():
+    # the module-level app was served without create_app(): no tables, no writer thread
+    if not _started:
+        create_app()
+
+
+def serve_web_workers(port, workers, config=None, host="0.0.0.0"):
+    """Prefork: `workers` processes accept on one listening socket, each runs create_app(config)."""
+    sock = socket.create_server((host, port), backlog=128)
+    sock.set_inheritable(True)
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            from werkzeug.serving import make_server
+
+            create_app(config)
+            make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+            os._exit(0)
+        pids.append(pid)
+    print("[WEB]", workers, "workers on port", port)
+    try:
+        for pid in pids:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
 
-threading.Thread(target=rfid_listener_forever, daemon=True).start()
-threading.Thread(target=motion_listener_forever, daemon=True).start()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, threaded=True)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PI SPACE H SECURITY")
+    parser.add_argument("--role", choices=ROLES, default=ROLE)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS, help="web worker processes (--role web)")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.role == "sensor":
+        create_app({"ROLE": "sensor"})
+        threading.Event().wait()   # everything runs in the service threads
+    elif args.role == "web" and args.workers > 1:
+        serve_web_workers(args.port, args.workers, {"ROLE": "web"})
+    else:
+        create_app({"ROLE": args.role}).run(host="0.0.0.0", port=args.port, threaded=True)
 
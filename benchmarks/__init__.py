@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmarks of the storage and serving hot paths.
+
+Every table size runs in its own process (python -m benchmarks.worker) on a
+scratch data dir with simulated hardware, so app.py's module-level setup
+starts clean each time. Results are latency percentiles and throughput per
+case and size; a run can be saved as a JSON baseline and compared with one:
+
+    python -m benchmarks --sizes 250,10000 --save benchmarks/baseline.json
+    python -m benchmarks --sizes 250,10000 --compare benchmarks/baseline.json
+"""
+
+import statistics
+import time
+
+from tracing import percentiles
+
+SIZES = (250, 10000, 1000000)
+
+# a case counts as regressed when its p50 got this much slower (or ops/s this much lower),
+# on top of the run-to-run spread both reports measured
+REGRESSION_THRESHOLD = 0.25
+REPEATS = 3             # runs per size, every figure is the median
+MIN_DELTA_MS = 0.05     # p50 differences below this are timer noise
+
+
+def measure(fn, iterations, setup=None):
+    """Latency percentiles (ms) and ops/s of fn(), setup() runs untimed before every call."""
+    samples = []
+    total = 0.0
+    for _ in range(iterations):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        samples.append(dt)
+        total += dt
+    return summarize(samples, total)
+
+
+def summarize(samples, wall_seconds, ops=None):
+    out = percentiles(samples)
+    out["ops_per_s"] = round((ops if ops is not None else len(samples)) / wall_seconds, 1) if wall_seconds else None
+    return out
+
+
+def merge_repeats(runs):
+    """{case: figures} of repeated runs at one size: medians, plus the relative spread of p50 and ops/s."""
+    merged = {}
+    for case in runs[0]:
+        results = [run[case] for run in runs if case in run]
+        out = {}
+        for key in results[0]:
+            values = [r[key] for r in results if r.get(key) is not None]
+            out[key] = round(statistics.median(values), 2) if values else None
+        for key in ("p50", "ops_per_s"):
+            values = [r[key] for r in results if r.get(key)]
+            if len(values) > 1 and out.get(key):
+                out[key + "_spread"] = round((max(values) - min(values)) / out[key], 3)
+        out["repeats"] = len(results)
+        merged[case] = out
+    return merged
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """[(case, size, what, old, new)] of everything that got worse by more than `threshold`
+    plus the spread between the repeats of both reports (single-run reports have none)."""
+    regressions = []
+    for case, sizes in current.get("results", {}).items():
+        for size, new in sizes.items():
+            old = baseline.get("results", {}).get(case, {}).get(size)
+            if not old:
+                continue
+            allowed = threshold + old.get("p50_spread", 0) + new.get("p50_spread", 0)
+            if (old.get("p50") and new.get("p50") and new["p50"] > old["p50"] * (1 + allowed)
+                    and new["p50"] - old["p50"] > MIN_DELTA_MS):
+                regressions.append((case, size, "p50_ms", old["p50"], new["p50"]))
+            allowed = threshold + old.get("ops_per_s_spread", 0) + new.get("ops_per_s_spread", 0)
+            if old.get("ops_per_s") and new.get("ops_per_s") and new["ops_per_s"] < old["ops_per_s"] * (1 - allowed):
+                regressions.append((case, size, "ops_per_s", old["ops_per_s"], new["ops_per_s"]))
+    return regressions
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""python -m benchmarks: run every size, print a table, save or compare a JSON baseline."""
+
+import argparse
+import json
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+
+from benchmarks import SIZES, REGRESSION_THRESHOLD, REPEATS, compare, merge_repeats
+
+
+def run_size(size, iterations):
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.worker", "--size", str(size), "--iterations", str(iterations)],
+        stdout=subprocess.PIPE, check=True
+    ).stdout.decode()
+    return json.loads(out)
+
+
+def print_table(report):
+    print("%-22s %9s %9s %9s %9s %11s" % ("case", "size", "p50 ms", "p95 ms", "p99 ms", "ops/s"))
+    for case, sizes in report["results"].items():
+        for size, r in sizes.items():
+            print("%-22s %9s %9s %9s %9s %11s" % (
+                case, size, r.get("p50"), r.get("p95"), r.get("p99"), r.get("ops_per_s")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="storage and serving micro-benchmarks")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SIZES), help="table sizes, comma separated")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="fresh runs per size, figures are medians")
+    parser.add_argument("--save", metavar="JSON", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="JSON", help="baseline to compare with, exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "iterations": args.iterations,
+            "repeats": args.repeats,
+        },
+        "results": {},
+    }
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        print("[BENCH] size", size, file=sys.stderr)
+        runs = [run_size(size, args.iterations) for _ in range(max(1, args.repeats))]
+        for case, r in merge_repeats(runs).items():
+            report["results"].setdefault(case, {})[str(size)] = r
+
+    print_table(report)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print("[BENCH] baseline saved to", args.save, file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for case, size, what, old, new in regressions:
+            print("[BENCH] REGRESSION %s @ %s: %s %s -> %s" % (case, size, what, old, new))
+        if regressions:
+            sys.exit(1)
+        print("[BENCH] no regressions against", args.compare, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Cold start of the app: `import app` and create_app() in fresh processes.
+
+    python -m benchmarks.coldstart --runs 10
+
+Runs without hardware on a scratch data dir. Exits 1 if the p50 of a
+phase is over its target, so a heavy module-level import or a new
+side effect at import time shows up right away.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+from tracing import percentiles
+
+# p50 targets in ms on a Raspberry Pi 5; most of `import` is Flask itself
+TARGETS_MS = {
+    "import": 500,
+    "create_app": 250,
+}
+
+CHILD = """
+import json, os, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.create_app({"HARDWARE": False, "DATA_DIR": sys.argv[1]})
+t2 = time.perf_counter()
+sys.stdout.write(json.dumps({"import": t1 - t0, "create_app": t2 - t1}) + "\\n")
+sys.stdout.flush()
+app.shutdown_thumb_pool()
+os._exit(0)
+"""
+
+
+def run_once():
+    data_dir = tempfile.mkdtemp(prefix="pi-space-cold-")
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD, data_dir], stdout=subprocess.PIPE, check=True).stdout
+    wall = time.perf_counter() - t0
+    result = json.loads(out.decode().strip().splitlines()[-1])
+    result["process"] = wall
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cold start time of app.py")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    run_once()   # .pyc files and page cache
+    samples = {}
+    for _ in range(args.runs):
+        for phase, seconds in run_once().items():
+            samples.setdefault(phase, []).append(seconds)
+
+    failed = False
+    print("%-12s %9s %9s %9s %9s" % ("phase", "p50 ms", "p95 ms", "max ms", "target"))
+    for phase in ("import", "create_app", "process"):
+        p = percentiles(samples[phase])
+        target = TARGETS_MS.get(phase)
+        over = target is not None and p["p50"] > target
+        failed = failed or over
+        print("%-12s %9s %9s %9s %9s%s" % (phase, p["p50"], p["p95"], p["max"], target or "-", "  OVER" if over else ""))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""One benchmark run at one table size, prints its results as JSON.
+
+    python -m benchmarks.worker --size 10000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import measure, summarize
+from simulator.hardware import setup_environment
+
+FILL_BATCH = 50000
+
+
+def jpeg_bytes():
+    from camera import SyntheticFrameSource
+    return SyntheticFrameSource(resolution="1280x720").render(1)
+
+
+def event_entry(i, epoch):
+    if i % 3:
+        return {"type": "MOTION", "status": "DETECTED", "event_id": "motion-%d" % i, "epoch": epoch, "zone": "main"}
+    return {"type": "RFID", "status": "AUTH" if i % 2 else "DENY", "uid": "%08X" % i,
+            "name": "Karte %d" % i, "door": "main", "epoch": epoch}
+
+
+def fill_events(app, count):
+    """`count` events through the writer (one transaction per batch), bypassing the cache."""
+    start = time.time() - count
+    done = 0
+    while done < count:
+        n = min(FILL_BATCH, count - done)
+
+        def fill(cur, first=done, n=n):
+            for i in range(first, first + n):
+                app._insert_event(cur, app.normalize_event(event_entry(i, start + i)))
+
+        app.db_writer.call("events", fill, timeout=600)
+        done += n
+
+
+def fill_photos(app, count, info):
+    done = 0
+    while done < count:
+        n = min(FILL_BATCH, count - done)
+
+        def fill(cur, n=n):
+            for _ in range(n):
+                app._insert_photo(cur, "bench.jpg", info, app.now_ts())
+
+        app.db_writer.call("photos", fill, timeout=600)
+        done += n
+
+
+def bench_insert_burst(app, count):
+    """`count` events submitted at once: group commit throughput, submit -> commit latency."""
+    samples = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def committed(t0):
+        def cb(_fut):
+            with lock:
+                samples.append(time.perf_counter() - t0)
+                if len(samples) == count:
+                    done.set()
+        return cb
+
+    t_start = time.perf_counter()
+    for i in range(count):
+        fut = app.submit_event(event_entry(i, time.time()))
+        fut.add_done_callback(committed(time.perf_counter()))
+    done.wait(120)
+    return summarize(samples, time.perf_counter() - t_start)
+
+
+def bench_sse(app, clients, events):
+    """record_event() -> data line read from the /events response, for every client."""
+    received = []
+    lock = threading.Lock()
+    sent_at = {}
+    ready = threading.Barrier(clients + 1)
+
+    def client():
+        resp = app.app.test_client().get("/events", buffered=False)
+        it = iter(resp.response)
+        ready.wait()
+        got = 0
+        while got < events:
+            chunk = next(it)
+            now = time.perf_counter()
+            for line in (chunk.decode() if isinstance(chunk, bytes) else chunk).splitlines():
+                if line.startswith("data: ") and '"bench-' in line:
+                    seq = json.loads(line[6:])["name"]
+                    with lock:
+                        received.append(now - sent_at[seq])
+                    got += 1
+        resp.close()
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    time.sleep(0.2)   # all subscribed
+
+    t_start = time.perf_counter()
+    for i in range(events):
+        seq = "bench-%d" % i
+        sent_at[seq] = time.perf_counter()
+        app.record_event({"type": "RFID", "status": "AUTH", "uid": "BENCH", "name": seq}, wait=False)
+    for t in threads:
+        t.join(60)
+    return summarize(received, time.perf_counter() - t_start, ops=len(received))
+
+
+def run(size, iterations):
+    data_dir = tempfile.mkdtemp(prefix="pi-space-bench-")
+    setup_environment(data_dir, {}, {}, camera="")
+    import app
+
+    app.create_app({"HARDWARE": False})
+
+    for table in ("events", "photos"):
+        app.RETENTION_POLICIES[table][0].max_rows = size
+    info = app.photo_store.put_bytes(jpeg_bytes())
+    fill_events(app, size)
+    fill_photos(app, size, info)
+    app.retention.sync()
+    app.warm_events_cache()
+
+    client = app.app.test_client()
+    photo_id = app.insert_photo_to_db("bench.jpg", info)
+    etag = client.get("/photo/%d" % photo_id).headers["ETag"]
+    extra = max(1, min(size // 10, 10000))
+
+    results = {
+        "insert_event_to_db": measure(lambda: app.insert_event_to_db(event_entry(0, time.time())), iterations),
+        "insert_event_burst": bench_insert_burst(app, iterations * 10),
+        "trim_events_db": measure(app.trim_events_db, 5, setup=lambda: fill_events(app, extra)),
+        "get_last_events": measure(lambda: app.get_last_events(limit=500), iterations),
+        "query_events_500": measure(lambda: app.query_events(limit=500), max(10, iterations // 10)),
+        "insert_photo_to_db": measure(lambda: app.insert_photo_to_db("bench.jpg", info), iterations),
+        "get_photo": measure(lambda: client.get("/photo/%d" % photo_id).close(), iterations),
+        "get_photo_304": measure(
+            lambda: client.get("/photo/%d" % photo_id, headers={"If-None-Match": etag}).close(), iterations
+        ),
+        "sse_1_client": bench_sse(app, 1, iterations),
+        "sse_10_clients": bench_sse(app, 10, iterations),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, required=True)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    # the app's [TAG] lines come from background threads too, keep them off the result
+    result_out, sys.stdout = sys.stdout, sys.stderr
+    results = run(args.size, args.iterations)
+    result_out.write(json.dumps(results) + "\n")
+    result_out.flush()
+    import app
+    app.shutdown_thumb_pool()
+    os._exit(0)   # the app's daemon threads
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""Persistent camera capture.
+
+CaptureEngine keeps the camera open and holds the last N encoded frames in
+a ring buffer, so a motion trigger can pick the frame closest to the PIR
+edge (or one from just before it) instead of starting fswebcam and waiting
+for the device and auto exposure.
+
+Bursts: burst() returns K consecutive frames around a trigger and
+select_sharpest() keeps the best of them by Laplacian variance (NumPy),
+scored within a time budget.
+
+Frame sources are pluggable. A source has open(), read() -> JPEG bytes
+(blocking until the next frame, None when the stream ended) and close():
+  - FfmpegMjpegSource: /dev/videoX through ffmpeg, MJPEG frames copied as is
+  - SyntheticFrameSource: generated frames for machines without a camera
+"""
+
+import io
+import subprocess
+import threading
+import time
+from collections import deque, namedtuple
+
+# monotonic: time.monotonic() when the frame arrived, epoch: time.time()
+Frame = namedtuple("Frame", "seq monotonic epoch data")
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+
+
+# ------------------ SOURCES ------------------
+class FfmpegMjpegSource:
+    """Reads a V4L2 device through ffmpeg and splits the MJPEG stream into frames.
+
+    With input_format="mjpeg" the camera's own JPEGs are passed through
+    (no encode on the Pi), other formats are encoded by ffmpeg.
+    """
+
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, device="/dev/video0", resolution="1280x720", fps=10,
+                 input_format="mjpeg", quality=5):
+        self.device = device
+        self.resolution = resolution
+        self.fps = fps
+        self.input_format = input_format
+        self.quality = quality
+        self._proc = None
+        self._buf = bytearray()
+
+    def command(self):
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-f", "v4l2",
+            "-input_format", self.input_format,
+            "-video_size", self.resolution,
+            "-framerate", str(self.fps),
+            "-i", self.device,
+        ]
+        if self.input_format == "mjpeg":
+            cmd += ["-c:v", "copy"]
+        else:
+            cmd += ["-c:v", "mjpeg", "-q:v", str(self.quality)]
+        return cmd + ["-f", "mjpeg", "pipe:1"]
+
+    def open(self):
+        self._buf = bytearray()
+        self._proc = subprocess.Popen(
+            self.command(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0
+        )
+
+    def read(self):
+        while True:
+            start = self._buf.find(SOI)
+            if start >= 0:
+                end = self._buf.find(EOI, start + 2)
+                if end >= 0:
+                    frame = bytes(self._buf[start:end + 2])
+                    del self._buf[:end + 2]
+                    return frame
+                if start > 0:
+                    del self._buf[:start]
+            elif len(self._buf) > 1:
+                del self._buf[:-1]
+
+            chunk = self._proc.stdout.read(self.READ_SIZE)
+            if not chunk:
+                return None
+            self._buf += chunk
+
+    def close(self):
+        proc, self._proc = self._proc, None
+        if not proc:
+            return
+        try:
+            proc.terminate()
+            proc.wait(timeout=2)
+        except Exception:
+            proc.kill()
+
+
+# 8x8 grey JPEG, used when Pillow is not available
+_TINY_JPEG = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300100b0c0e0c0a100e0d0e1211101318281a18161618"
+    "3123251d283a333d3c3933383740485c4e404457453738506d51575f626768673e4d71797064785c656763ffc0000b"
+    "080008000801011100ffc4001f0000010501010101010100000000000000000102030405060708090a0bffc400b510"
+    "0002010303020403050504040000017d01020300041105122131410613516107227114328191a1082342b1c11552d1"
+    "f02433627282090a161718191a25262728292a3435363738393a434445464748494a535455565758595a6364656667"
+    "68696a737475767778797a838485868788898a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2"
+    "c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffda0008010100003f00"
+    "2bffd9"
+)
+
+
+class SyntheticFrameSource:
+    """Generates JPEG frames at a fixed rate, for tests and benchmarks.
+
+    With Pillow a moving bar and the frame number are drawn (blur_every > 0
+    blurs every n-th frame, to exercise sharpness scoring). Without Pillow
+    every frame is a tiny JPEG with the sequence number in a comment segment.
+    """
+
+    def __init__(self, resolution="640x360", fps=10, blur_every=0, quality=80):
+        w, h = resolution.lower().split("x")
+        self.size = (int(w), int(h))
+        self.fps = float(fps)
+        self.blur_every = int(blur_every)
+        self.quality = quality
+        self._n = 0
+        self._next = None
+
+    def open(self):
+        self._n = 0
+        self._next = time.monotonic()
+
+    def render(self, n):
+        try:
+            from PIL import Image, ImageDraw, ImageFilter
+        except ImportError:
+            comment = ("frame %d" % n).encode()
+            return SOI + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + _TINY_JPEG[2:]
+
+        w, h = self.size
+        im = Image.new("L", self.size, 40)
+        draw = ImageDraw.Draw(im)
+        x = (n * 7) % max(1, w - w // 8)
+        draw.rectangle([x, h // 4, x + w // 8, 3 * h // 4], fill=220)
+        for gx in range(0, w, 16):
+            draw.line([gx, 0, gx, h // 8], fill=255 if (gx // 16) % 2 else 0)
+        draw.text((8, h - 20), "frame %d" % n, fill=255)
+        if self.blur_every and n % self.blur_every == 0:
+            im = im.filter(ImageFilter.GaussianBlur(4))
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=self.quality)
+        return out.getvalue()
+
+    def read(self):
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = max(self._next + 1.0 / self.fps, time.monotonic())
+        self._n += 1
+        return self.render(self._n)
+
+    def close(self):
+        pass
+
+
+# ------------------ SHARPNESS ------------------
+def sharpness(jpeg, max_side=320):
+    """Focus measure of a JPEG, higher is sharper.
+
+    Variance of the 4-neighbour Laplacian on a downsampled grayscale decode
+    (JPEG draft mode decodes at 1/2..1/8 scale, so this stays cheap on a Pi).
+    Without NumPy/Pillow the JPEG size is used: at equal quality a sharper
+    frame has more high frequency content and compresses worse.
+    """
+    try:
+        import numpy as np
+        from PIL import Image
+    except ImportError:
+        return float(len(jpeg))
+
+    im = Image.open(io.BytesIO(jpeg))
+    im.draft("L", (max_side, max_side))
+    im = im.convert("L")
+    im.thumbnail((max_side, max_side))
+    a = np.asarray(im, dtype=np.float32)
+    if a.shape[0] < 3 or a.shape[1] < 3:
+        return 0.0
+    lap = a[:-2, 1:-1] + a[2:, 1:-1] + a[1:-1, :-2] + a[1:-1, 2:] - 4.0 * a[1:-1, 1:-1]
+    return float(lap.var())
+
+
+def select_sharpest(frames, keep=1, budget_seconds=0.2, max_side=320):
+    """Best `keep` frames as [(score, frame)], sharpest first.
+
+    Frames are scored in the given order until the budget is used up, the
+    rest is skipped, so pass the most wanted frames first. At least one
+    frame is always scored.
+    """
+    deadline = time.monotonic() + budget_seconds
+    scored = []
+    for f in frames:
+        if scored and time.monotonic() >= deadline:
+            break
+        try:
+            scored.append((sharpness(f.data, max_side), f))
+        except Exception:
+            continue
+    scored.sort(key=lambda sf: sf[0], reverse=True)
+    return scored[:max(1, keep)]
+
+
+# ------------------ ENGINE ------------------
+class CaptureEngine:
+    """Reads frames from one source in a background thread into a ring buffer."""
+
+    def __init__(self, source_factory, ring_size=30, reconnect_seconds=2.0, stale_seconds=2.0,
+                 max_reconnect_seconds=60.0):
+        self.source_factory = source_factory
+        self.ring = deque(maxlen=ring_size)
+        self.reconnect_seconds = reconnect_seconds
+        self.max_reconnect_seconds = max_reconnect_seconds
+        self.stale_seconds = stale_seconds
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._running = False
+        self._thread = None
+        self.frames_total = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="capture", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=3.0):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_live(self):
+        """True if the newest frame is recent, i.e. the camera is delivering."""
+        with self._cond:
+            if not self.ring:
+                return False
+            return time.monotonic() - self.ring[-1].monotonic < self.stale_seconds
+
+    def latest(self):
+        with self._cond:
+            return self.ring[-1] if self.ring else None
+
+    def wait_frame(self, after_seq=0, timeout=None):
+        """Oldest buffered frame with seq > after_seq, waits for it if needed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._running:
+                if self.ring and self.ring[-1].seq > after_seq:
+                    for f in self.ring:
+                        if f.seq > after_seq:
+                            return f
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+        return None
+
+    def wait_latest(self, after_seq=0, timeout=None):
+        """Newest frame if it is newer than after_seq, waits for one if needed.
+
+        Unlike wait_frame() this skips whatever a slow reader missed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._running:
+                if self.ring and self.ring[-1].seq > after_seq:
+                    return self.ring[-1]
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+        return None
+
+    def frames_between(self, start, end):
+        """Buffered frames with start <= monotonic <= end, oldest first."""
+        with self._cond:
+            return [f for f in self.ring if start <= f.monotonic <= end]
+
+    def frame_at(self, ts, max_wait=1.0):
+        """Frame closest to monotonic time `ts`.
+
+        If no frame after `ts` is buffered yet, wait (up to max_wait) for the
+        next one, so the result is the best of "just before" and "just after".
+        """
+        with self._cond:
+            deadline = time.monotonic() + max_wait
+            while self._running and (not self.ring or self.ring[-1].monotonic < ts):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if not self.ring:
+                return None
+            return min(self.ring, key=lambda f: abs(f.monotonic - ts))
+
+    def burst(self, ts, count, max_wait=1.0):
+        """`count` consecutive frames starting at the one closest to `ts`."""
+        first = self.frame_at(ts, max_wait)
+        if not first:
+            return []
+        frames = [first]
+        deadline = time.monotonic() + max_wait + count / 5.0
+        while len(frames) < count:
+            f = self.wait_frame(frames[-1].seq, max(0.0, deadline - time.monotonic()))
+            if not f:
+                break
+            frames.append(f)
+        return frames
+
+    def stats(self):
+        with self._cond:
+            newest = self.ring[-1] if self.ring else None
+            return {
+                "running": self._running,
+                "frames_total": self.frames_total,
+                "buffered": len(self.ring),
+                "errors": self.errors,
+                "last_frame_age": None if newest is None else round(time.monotonic() - newest.monotonic, 3),
+            }
+
+    def _run(self):
+        delay = self.reconnect_seconds
+        while self._running:
+            source = None
+            try:
+                source = self.source_factory()
+                source.open()
+                print("[CAMERA] capture engine running")
+                while self._running:
+                    data = source.read()
+                    if not data:
+                        raise IOError("frame source ended")
+                    delay = self.reconnect_seconds
+                    now = time.monotonic()
+                    with self._cond:
+                        self._seq += 1
+                        self.ring.append(Frame(self._seq, now, time.time(), data))
+                        self.frames_total += 1
+                        self._cond.notify_all()
+            except Exception as e:
+                self.errors += 1
+                print("[CAMERA] capture engine error:", e)
+            finally:
+                if source:
+                    try:
+                        source.close()
+                    except Exception:
+                        pass
+            if self._running:
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_seconds)
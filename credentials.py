@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""RFID credentials and the access decision.
+
+credentials.db holds one row per card (uid, label, enabled flag, validity
+window, time-of-day schedule). The RFID loop never reads the DB: it decides
+against a CredentialSnapshot, an immutable dict built from all rows. After
+every change a new snapshot is built and swapped in as a whole, so a decision
+always sees one consistent version and needs one dict lookup.
+
+No hardware or Flask imports, like photostore.py and camera.py.
+"""
+
+import json
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+CREDENTIALS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS credentials (
+        uid TEXT PRIMARY KEY,
+        label TEXT NOT NULL,
+        enabled INTEGER NOT NULL DEFAULT 1,
+        valid_from REAL,
+        valid_until REAL,
+        schedule TEXT,
+        updated_at REAL
+    )
+"""
+
+CREDENTIAL_COLUMNS = "uid, label, enabled, valid_from, valid_until, schedule, updated_at"
+
+DAY_NAMES = ("mo", "di", "mi", "do", "fr", "sa", "so")
+
+# windows: tuple of (days as frozenset of weekday numbers, start minute, end minute)
+Credential = namedtuple("Credential", "uid label enabled valid_from valid_until windows schedule")
+
+
+def normalize_uid(uid):
+    return (uid or "").strip().upper()
+
+
+# ------------------ SCHEDULE ------------------
+def _parse_minute(text):
+    h, m = text.split(":")
+    h, m = int(h), int(m)
+    if not (0 <= h <= 24 and 0 <= m < 60) or (h == 24 and m):
+        raise ValueError("bad time: " + text)
+    return h * 60 + m
+
+
+def _parse_days(days):
+    if days is None:
+        return frozenset(range(7))
+    if isinstance(days, str):
+        # "mo-fr" or "sa"
+        parts = days.lower().split("-")
+        idx = [DAY_NAMES.index(p.strip()[:2]) for p in parts]
+        if len(idx) == 1:
+            return frozenset(idx)
+        a, b = idx
+        return frozenset((a + i) % 7 for i in range(((b - a) % 7) + 1))
+    out = set()
+    for d in days:
+        out |= _parse_days(d) if isinstance(d, str) else {int(d)}
+    if not out or not all(0 <= d < 7 for d in out):
+        raise ValueError("bad days: %r" % (days,))
+    return frozenset(out)
+
+
+def parse_schedule(schedule):
+    """Windows from a schedule, None (or empty) means at any time.
+
+    A schedule is a list like [{"days": "mo-fr", "from": "07:00", "to": "19:00"}],
+    days may also be a list of weekday numbers (0 = Monday). A window with
+    from > to runs over midnight. Raises ValueError for anything else.
+    """
+    if isinstance(schedule, str):
+        schedule = json.loads(schedule) if schedule.strip() else None
+    if not schedule:
+        return ()
+    windows = []
+    try:
+        for w in schedule:
+            windows.append((_parse_days(w.get("days")), _parse_minute(w["from"]), _parse_minute(w["to"])))
+    except (KeyError, TypeError, AttributeError, IndexError) as e:
+        raise ValueError("bad schedule: %r (%s)" % (schedule, e))
+    return tuple(windows)
+
+
+def in_windows(windows, epoch):
+    if not windows:
+        return True
+    t = time.localtime(epoch)
+    minute = t.tm_hour * 60 + t.tm_min
+    yesterday = (t.tm_wday - 1) % 7
+    for days, start, end in windows:
+        if start <= end:
+            if t.tm_wday in days and start <= minute < end:
+                return True
+        # over midnight: evening part belongs to the day, morning part to the day before
+        elif (t.tm_wday in days and minute >= start) or (yesterday in days and minute < end):
+            return True
+    return False
+
+
+# ------------------ SNAPSHOT ------------------
+def row_to_credential(row):
+    uid, label, enabled, valid_from, valid_until, schedule, _updated_at = row
+    return Credential(
+        uid=uid,
+        label=label,
+        enabled=bool(enabled),
+        valid_from=valid_from,
+        valid_until=valid_until,
+        windows=parse_schedule(schedule),
+        schedule=json.loads(schedule) if schedule else None,
+    )
+
+
+class CredentialSnapshot:
+    """Read-only uid -> Credential view of the whole credentials table."""
+
+    def __init__(self, credentials=(), version=0):
+        self.cards = MappingProxyType({c.uid: c for c in credentials})
+        self.version = version
+
+    def __len__(self):
+        return len(self.cards)
+
+    def decide(self, uid, epoch=None):
+        """("AUTH" | "DENY", name, reason), reason is None for AUTH."""
+        c = self.cards.get(normalize_uid(uid))
+        if c is None:
+            return "DENY", "Unbekannt", "unknown"
+        if not c.enabled:
+            return "DENY", c.label, "disabled"
+        if epoch is None:
+            epoch = time.time()
+        if c.valid_from is not None and epoch < c.valid_from:
+            return "DENY", c.label, "not_yet_valid"
+        if c.valid_until is not None and epoch >= c.valid_until:
+            return "DENY", c.label, "expired"
+        if not in_windows(c.windows, epoch):
+            return "DENY", c.label, "outside_schedule"
+        return "AUTH", c.label, None
+
+
+class CredentialStore:
+    """Holds the current snapshot; readers take `current` once per decision.
+
+    load() builds a new snapshot and replaces the reference in one assignment,
+    readers never lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()   # only orders writers (version numbers)
+        self.current = CredentialSnapshot()
+
+    def load(self, rows):
+        with self._lock:
+            snapshot = CredentialSnapshot([row_to_credential(r) for r in rows], self.current.version + 1)
+            self.current = snapshot
+        return snapshot
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Counters, gauges and histograms in the Prometheus text format.
+
+A small stand-in for prometheus_client (not installed on the Pi): metrics
+register themselves in a Registry, render() produces the text served at
+/metrics. Observing is a bisect and a short lock, so it stays on in
+production. Gauges are callbacks evaluated at scrape time, nothing is
+sampled in between.
+
+Read a running app like a scraper would:
+    python metrics.py http://localhost:5000/metrics
+"""
+
+import bisect
+import math
+import sys
+import threading
+import time
+
+# seconds, from sub-millisecond DB/SSE work up to slow captures
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join('%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for m in metrics:
+            lines.append("# HELP %s %s" % (m.name, m.help))
+            lines.append("# TYPE %s %s" % (m.name, m.kind))
+            try:
+                lines.extend(m.samples())
+            except Exception as e:
+                # one broken gauge must not take the whole scrape down
+                lines.append("# %s failed: %s" % (m.name, _escape(e)))
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return ["%s%s %s" % (self.name, _labels(self.labelnames, k), _num(v)) for k, v in items]
+
+
+class Gauge:
+    """fn() returns a number, or {label values tuple: number} with labelnames."""
+
+    kind = "gauge"
+
+    def __init__(self, registry, name, help, fn, labelnames=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def samples(self):
+        value = self.fn()
+        if not self.labelnames:
+            return ["%s %s" % (self.name, _num(value))]
+        return ["%s%s %s" % (self.name, _labels(self.labelnames, k), _num(v)) for k, v in sorted(value.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # labels -> [counts per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            series = [(k, list(v[0]), v[1]) for k, v in sorted(self._series.items())]
+        out = []
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                out.append("%s_bucket%s %d" % (
+                    self.name, _labels(self.labelnames + ("le",), labels + (_num(bound),)), cumulative))
+            out.append("%s_sum%s %s" % (self.name, _labels(self.labelnames, labels), repr(total)))
+            out.append("%s_count%s %d" % (self.name, _labels(self.labelnames, labels), cumulative))
+        return out
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.t0, *self.labels)
+        return False
+
+
+# ------------------ SCRAPER STAND-IN ------------------
+def parse_text(text):
+    """{(name, labels string): value} from the text format (comments skipped)."""
+    out = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        key, _, value = line.rpartition(" ")
+        name, _, labels = key.partition("{")
+        out[(name, labels.rstrip("}"))] = float(value)
+    return out
+
+
+def histogram_quantile(q, buckets):
+    """Prometheus-style quantile from [(upper bound, cumulative count)]."""
+    buckets = sorted(buckets)
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    prev_bound, prev_count = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == math.inf:
+                return prev_bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / max(count - prev_count, 1)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def summarize(samples):
+    """Lines "name{labels} count=.. p50=.. p95=.." for histograms, "name{labels} value" otherwise."""
+    hist = {}
+    lines = []
+    for (name, labels), value in sorted(samples.items()):
+        if name.endswith("_bucket"):
+            parts = [p for p in labels.split(",") if p and not p.startswith("le=")]
+            le = [p for p in labels.split(",") if p.startswith("le=")][0][4:-1]
+            bound = math.inf if le == "+Inf" else float(le)
+            hist.setdefault((name[:-7], ",".join(parts)), []).append((bound, value))
+        elif not name.endswith(("_sum", "_count")):
+            lines.append("%s%s %s" % (name, "{%s}" % labels if labels else "", _num(value)))
+    for (name, labels), buckets in sorted(hist.items()):
+        n = max(c for _b, c in buckets)
+        q = [histogram_quantile(p, buckets) for p in (0.5, 0.95)]
+        lines.append("%s%s count=%d p50=%s p95=%s" % (
+            name, "{%s}" % labels if labels else "", n,
+            *("%.2fms" % (v * 1000) if v is not None else "-" for v in q)))
+    return lines
+
+
+if __name__ == "__main__":
+    from urllib.request import urlopen
+
+    url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:5000/metrics"
+    with urlopen(url, timeout=5) as resp:
+        print("\n".join(summarize(parse_text(resp.read().decode("utf-8")))))
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed photo files on disk.
+
+Photos live under the photo directory as <sha256[:2]>/<sha256><ext>, photos.db
+only keeps the metadata (path, size, hash, mime, dimensions). This module has
+no hardware or Flask imports, so tools and worker processes can use it alone.
+
+Thumbnails and previews are stored next to the original as
+<sha256>.<kind>.jpg. They are made by make_renditions(), which is meant to run
+in a worker process and needs Pillow (optional, imported on first use).
+
+Export the BLOBs of an old photos.db:
+    python photostore.py export photos.db static/photos
+"""
+
+import hashlib
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+MIME_EXT = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+PHOTOS_SCHEMA_VERSION = 2
+
+PHOTOS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        mime TEXT,
+        width INTEGER,
+        height INTEGER,
+        created_at TEXT,
+        created_at_epoch REAL
+    )
+"""
+
+PHOTO_COLUMNS = "id, filename, path, size, sha256, mime, width, height, created_at, created_at_epoch"
+
+
+# ------------------ IMAGE HEADERS ------------------
+def sniff_image(head):
+    """Return (mime, width, height) from the first bytes of a file, None if unknown."""
+    if head[:3] == b"\xff\xd8\xff":
+        return ("image/jpeg",) + _jpeg_size(head)
+    if head[:8] == b"\x89PNG\r\n\x1a\n" and len(head) >= 24:
+        w, h = struct.unpack(">II", head[16:24])
+        return "image/png", w, h
+    if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+        w, h = struct.unpack("<HH", head[6:10])
+        return "image/gif", w, h
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ("image/webp",) + _webp_size(head)
+    return None
+
+
+def _jpeg_size(data):
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        seg_len = struct.unpack(">H", data[i + 2:i + 4])[0]
+        # SOFn frames, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h, w = struct.unpack(">HH", data[i + 5:i + 9])
+            return w, h
+        i += 2 + seg_len
+    return None, None
+
+
+def _webp_size(data):
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        w, h = struct.unpack("<HH", data[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25:
+        b = data[21:25]
+        w = 1 + (((b[1] & 0x3F) << 8) | b[0])
+        h = 1 + (((b[3] & 0x0F) << 10) | (b[2] << 2) | ((b[1] & 0xC0) >> 6))
+        return w, h
+    if chunk == b"VP8X" and len(data) >= 30:
+        w = 1 + int.from_bytes(data[24:27], "little")
+        h = 1 + int.from_bytes(data[27:30], "little")
+        return w, h
+    return None, None
+
+
+# ------------------ STORE ------------------
+class PhotoStore:
+    """Files addressed by their sha256, identical photos are stored once.
+
+    `renditions` maps a kind ("thumb", ...) to its (max width, max height).
+    """
+
+    # enough header for SOF markers behind EXIF/thumbnail segments
+    SNIFF_BYTES = 256 * 1024
+
+    def __init__(self, root, renditions=None):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, ".tmp")
+        self.renditions = dict(renditions or {})
+
+    def ensure_dirs(self):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def abspath(self, rel):
+        path = os.path.abspath(os.path.join(self.root, rel))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError("path outside photo store: " + rel)
+        return path
+
+    def tmp_path(self, suffix=".jpg"):
+        """Fresh path on the store's filesystem (so the final rename is atomic)."""
+        self.ensure_dirs()
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.tmp_dir)
+        os.close(fd)
+        return path
+
+    def put_file(self, src_path, mime=None):
+        """Move src_path into the store, return its metadata dict."""
+        h = hashlib.sha256()
+        size = 0
+        head = b""
+        with open(src_path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(head) < self.SNIFF_BYTES:
+                    head += chunk[:self.SNIFF_BYTES - len(head)]
+                h.update(chunk)
+                size += len(chunk)
+        return self.commit_tmp(src_path, h.hexdigest(), size, head, mime)
+
+    def put_bytes(self, data, mime=None):
+        tmp = self.tmp_path()
+        with open(tmp, "wb") as f:
+            f.write(data)
+        return self.put_file(tmp, mime)
+
+    def commit_tmp(self, tmp, sha256, size, head, mime=None):
+        """Atomically rename an already hashed temp file to its final place."""
+        sniffed = sniff_image(head) or (None, None, None)
+        mime = sniffed[0] or mime or "application/octet-stream"
+        rel = sha256[:2] + "/" + sha256 + MIME_EXT.get(mime, ".bin")
+        dst = self.abspath(rel)
+
+        if os.path.exists(dst):
+            os.remove(tmp)  # same content already stored
+        else:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, dst)
+
+        return {
+            "path": rel,
+            "size": size,
+            "sha256": sha256,
+            "mime": mime,
+            "width": sniffed[1],
+            "height": sniffed[2],
+        }
+
+    def rendition_path(self, rel, kind):
+        return self.abspath(rendition_rel(rel, kind))
+
+    def missing_renditions(self, rel):
+        """[(abs path, size)] of the renditions of `rel` that are not on disk yet."""
+        out = []
+        for kind, size in self.renditions.items():
+            path = self.rendition_path(rel, kind)
+            if not os.path.exists(path):
+                out.append((path, size))
+        return out
+
+    def remove(self, rel):
+        for path in [self.abspath(rel)] + [self.rendition_path(rel, k) for k in self.renditions]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# ------------------ STREAMING ------------------
+class FileTooLarge(Exception):
+    """A streamed file went over its size limit."""
+
+
+class HashingWriter:
+    """Temp file in the store that is hashed and sniffed while it is written.
+
+    Used as the stream of uploaded files, so an upload is never held in memory
+    and never read a second time. commit() renames it into the store,
+    discard() removes it (also safe after commit).
+    """
+
+    def __init__(self, store, max_bytes=None):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.path = store.tmp_path(".part")
+        self.size = 0
+        self.head = b""
+        self._hash = hashlib.sha256()
+        self._f = open(self.path, "w+b")
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise FileTooLarge("more than %d bytes" % self.max_bytes)
+        if len(self.head) < PhotoStore.SNIFF_BYTES:
+            self.head += bytes(data[:PhotoStore.SNIFF_BYTES - len(self.head)])
+        self._hash.update(data)
+        return self._f.write(data)
+
+    def copy_from(self, src):
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            self.write(chunk)
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+    def seek(self, offset, whence=0):
+        return self._f.seek(offset, whence)
+
+    def tell(self):
+        return self._f.tell()
+
+    def flush(self):
+        self._f.flush()
+
+    def image(self):
+        """(mime, width, height) of what was written so far, None if it is no known image."""
+        return sniff_image(self.head)
+
+    def commit(self, mime=None):
+        self._f.close()
+        info = self.store.commit_tmp(self.path, self._hash.hexdigest(), self.size, self.head, mime)
+        self.path = None
+        return info
+
+    def discard(self):
+        self._f.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    close = discard
+
+
+# ------------------ RENDITIONS ------------------
+def rendition_rel(rel, kind):
+    return os.path.splitext(rel)[0] + "." + kind + ".jpg"
+
+
+def make_renditions(src, targets, quality=80):
+    """Decode `src` once and write a JPEG for every (dst, (w, h)) target.
+
+    Runs in a worker process so decode and resize never hold the web
+    process' GIL. For JPEGs the decoder is asked for a reduced scale
+    (draft), which is most of the speedup on a Pi.
+    """
+    from PIL import Image, ImageOps
+
+    targets = sorted(targets, key=lambda t: t[1][0] * t[1][1], reverse=True)
+    with Image.open(src) as im:
+        im.draft("RGB", targets[0][1])
+        im = ImageOps.exif_transpose(im).convert("RGB")
+        # largest first, every smaller one is shrunk from the previous result
+        for dst, size in targets:
+            im.thumbnail(size, Image.BILINEAR)
+            tmp = dst + "." + str(os.getpid()) + ".tmp"
+            im.save(tmp, "JPEG", quality=quality, optimize=True)
+            os.replace(tmp, dst)
+    return [dst for dst, _size in targets]
+
+
+# ------------------ MIGRATION ------------------
+def export_blobs(conn, store):
+    """One-shot migration of a BLOB photos table to the metadata-only schema.
+
+    BLOBs are written to the store one row at a time (never all in memory),
+    ids stay the same. Returns the number of exported photos, 0 if there was
+    nothing to do.
+    """
+    cur = conn.cursor()
+    cur.execute("PRAGMA table_info(photos)")
+    columns = {r[1] for r in cur.fetchall()}
+    if "image" not in columns:
+        return 0
+
+    print("[PHOTOS] exporting BLOBs from photos.db to", store.root)
+    has_epoch = "created_at_epoch" in columns
+    cur.execute("SELECT id FROM photos ORDER BY id ASC")
+    ids = [r[0] for r in cur.fetchall()]
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DROP TABLE IF EXISTS photos_v2")
+        conn.execute(PHOTOS_TABLE_SQL.format(name="photos_v2"))
+
+        for photo_id in ids:
+            row = conn.execute(
+                "SELECT filename, image, created_at, mime, "
+                + ("created_at_epoch" if has_epoch else "NULL")
+                + " FROM photos WHERE id=?",
+                (photo_id,)
+            ).fetchone()
+            filename, image, created_at, mime, epoch = row
+            if not image:
+                continue
+            info = store.put_bytes(bytes(image), mime)
+            conn.execute(
+                "INSERT INTO photos_v2 (" + PHOTO_COLUMNS + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (photo_id, filename, info["path"], info["size"], info["sha256"], info["mime"],
+                 info["width"], info["height"], created_at, epoch)
+            )
+
+        # DROP TABLE takes the AUTOINCREMENT counter along: keep it, or ids of rows that
+        # were deleted before the export come back
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'photos'").fetchone()
+        conn.execute("DROP TABLE photos")
+        conn.execute("ALTER TABLE photos_v2 RENAME TO photos")
+        if seq:
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = 'photos'")
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('photos', ?)", seq)
+        conn.execute("PRAGMA user_version = " + str(PHOTOS_SCHEMA_VERSION))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    # give the space of the BLOBs back to the filesystem
+    conn.execute("VACUUM")
+    print("[PHOTOS] exported", len(ids), "photos")
+    return len(ids)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "export":
+        print("usage: python photostore.py export <photos.db> <photo dir>")
+        sys.exit(2)
+    db = sqlite3.connect(sys.argv[2], isolation_level=None)
+    export_blobs(db, PhotoStore(sys.argv[3]))
+    db.close()
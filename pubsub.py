@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Local pub/sub between the sensor process and the web workers.
+
+One Hub (in the sensor process) listens on a Unix domain socket, any
+number of Links (one per web worker) connect to it. Messages are JSON
+objects, one per line, in both directions: the hub broadcasts to all
+links, a link sends to the hub. on_message gets every received message.
+
+Sending never blocks the caller: messages are queued per connection and
+written by the hub's own selector thread. A link that does not read
+(more than `max_buffer` bytes queued) is disconnected; it reconnects and
+resyncs from the databases in on_connect. Links reconnect with backoff,
+so workers and sensor process can be restarted independently.
+"""
+
+import json
+import os
+import selectors
+import socket
+import threading
+import time
+
+
+def encode(msg):
+    return (json.dumps(msg, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _lines(buf, data):
+    """Append data to buf, return the complete lines as parsed messages."""
+    buf += data
+    out = []
+    while True:
+        i = buf.find(b"\n")
+        if i < 0:
+            return out
+        line = bytes(buf[:i])
+        del buf[:i + 1]
+        if line.strip():
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                print("[CHANNEL] dropping invalid message")
+
+
+class _Conn:
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+
+
+class Hub:
+    """Listening side. on_message(msg, conn) runs on the hub thread."""
+
+    def __init__(self, path, on_message=None, max_buffer=4 * 1024 * 1024):
+        self.path = path
+        self.on_message = on_message
+        self.max_buffer = max_buffer
+        self._sel = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._conns = set()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._server = None
+        self._thread = None
+        self.sent = 0
+        self.dropped = 0
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)   # stale socket of a previous run
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        os.chmod(self.path, 0o660)
+        self._server.listen(64)
+        self._server.setblocking(False)
+        self._sel.register(self._server, selectors.EVENT_READ, "accept")
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, "wake")
+        self._thread = threading.Thread(target=self._run, name="channel-hub", daemon=True)
+        self._thread.start()
+        print("[CHANNEL] listening on", self.path)
+        return self
+
+    def send(self, msg, exclude=None):
+        """Queue msg for every connected link (but `exclude`)."""
+        data = encode(msg)
+        with self._lock:
+            for conn in self._conns:
+                if conn is not exclude:
+                    conn.outbuf += data
+            self.sent += 1
+        try:
+            self._wake_w.send(b"\0")
+        except BlockingIOError:
+            pass   # the hub thread has wake-ups pending already
+
+    def subscribers(self):
+        with self._lock:
+            return len(self._conns)
+
+    def stats(self):
+        with self._lock:
+            return {"path": self.path, "subscribers": len(self._conns), "sent": self.sent, "dropped": self.dropped}
+
+    # ------------------ LOOP ------------------
+    def _run(self):
+        while True:
+            for key, mask in self._sel.select():
+                if key.data == "accept":
+                    self._accept()
+                elif key.data == "wake":
+                    try:
+                        self._wake_r.recv(4096)
+                    except BlockingIOError:
+                        pass
+                else:
+                    if mask & selectors.EVENT_READ:
+                        self._read(key.data)
+            self._flush()
+
+    def _accept(self):
+        try:
+            sock, _addr = self._server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        conn = _Conn(sock)
+        with self._lock:
+            self._conns.add(conn)
+        self._sel.register(sock, selectors.EVENT_READ, conn)
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close(conn)
+            return
+        for msg in _lines(conn.inbuf, data):
+            if self.on_message:
+                try:
+                    self.on_message(msg, conn)
+                except Exception as e:
+                    print("[CHANNEL] handler failed:", e)
+
+    def _flush(self):
+        with self._lock:
+            conns = list(self._conns)
+        for conn in conns:
+            with self._lock:
+                if conn not in self._conns:
+                    continue   # closed by _read in this round
+                if len(conn.outbuf) > self.max_buffer:
+                    self.dropped += 1
+                    overrun = True
+                else:
+                    overrun = False
+                    data = bytes(conn.outbuf)
+            if overrun:
+                print("[CHANNEL] dropping a subscriber that does not read")
+                self._close(conn)
+                continue
+            if not data:
+                self._sel.modify(conn.sock, selectors.EVENT_READ, conn)
+                continue
+            try:
+                n = conn.sock.send(data)
+            except BlockingIOError:
+                n = 0
+            except OSError:
+                self._close(conn)
+                continue
+            with self._lock:
+                del conn.outbuf[:n]
+                pending = bool(conn.outbuf)
+            # wake up again when the socket has room for the rest
+            self._sel.modify(conn.sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if pending else 0), conn)
+
+    def _close(self, conn):
+        with self._lock:
+            if conn not in self._conns:
+                return
+            self._conns.discard(conn)
+        try:
+            self._sel.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+
+
+class Link:
+    """Connecting side. on_message(msg) runs on the link thread, on_connect() after every (re)connect."""
+
+    def __init__(self, path, on_message, on_connect=None, reconnect_seconds=0.5, max_reconnect_seconds=5.0):
+        self.path = path
+        self.on_message = on_message
+        self.on_connect = on_connect
+        self.reconnect_seconds = reconnect_seconds
+        self.max_reconnect_seconds = max_reconnect_seconds
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._thread = None
+        self.connects = 0
+        self.received = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="channel-link", daemon=True)
+        self._thread.start()
+        return self
+
+    def connected(self):
+        return self._sock is not None
+
+    def send(self, msg):
+        """Send to the hub, False if not connected (the message is dropped)."""
+        sock = self._sock
+        if sock is None:
+            return False
+        try:
+            with self._send_lock:
+                sock.sendall(encode(msg))
+            return True
+        except OSError:
+            return False
+
+    def stats(self):
+        return {"path": self.path, "connected": self.connected(), "connects": self.connects,
+                "received": self.received}
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                sock.close()
+                backoff = min(max(backoff * 2, self.reconnect_seconds), self.max_reconnect_seconds)
+                if backoff in (self.reconnect_seconds, self.max_reconnect_seconds):
+                    print("[CHANNEL]", self.path + ":", e, "- retry in", backoff, "s")
+                time.sleep(backoff)
+                continue
+
+            backoff = 0.0
+            self._sock = sock
+            self.connects += 1
+            print("[CHANNEL] connected to", self.path)
+            if self.on_connect:
+                try:
+                    self.on_connect()
+                except Exception as e:
+                    print("[CHANNEL] on_connect failed:", e)
+
+            buf = bytearray()
+            while True:
+                try:
+                    data = sock.recv(65536)
+                except OSError:
+                    data = b""
+                if not data:
+                    break
+                for msg in _lines(buf, data):
+                    self.received += 1
+                    try:
+                        self.on_message(msg)
+                    except Exception as e:
+                        print("[CHANNEL] handler failed:", e)
+            self._sock = None
+            sock.close()
+            print("[CHANNEL] lost", self.path)
+            time.sleep(self.reconnect_seconds)   # the hub is probably shutting down
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""RFID readers of several doors on one selector loop.
+
+Every door has its own serial port (an Arduino sending "UID:..." lines and
+expecting "AUTH"/"DENY" back). ReaderLoop opens all ports non-blocking and
+services them from a single thread with selectors: bytes are reassembled into
+lines per port, every line goes to handle_line(door, line) and the bytes it
+returns are written back to the same port right away. A port that fails is
+closed and reopened with exponential backoff, the other doors keep working.
+
+Ports are opened through `opener(path, baudrate)` (pyserial by default, a
+pty works the same way), so the loop can be tested without hardware.
+on_reply(door, seconds) gets the time from reading a line to writing its reply.
+"""
+
+import selectors
+import threading
+import time
+
+MAX_LINE = 256   # longer "lines" are garbage (wrong baudrate, noise) and dropped
+
+
+def open_serial(path, baudrate):
+    import serial   # pyserial, only needed with real ports
+
+    # timeout=0: read() returns what is there, the selector says when
+    return serial.Serial(path, baudrate, timeout=0)
+
+
+class _Port:
+    def __init__(self, door, path):
+        self.door = door
+        self.path = path
+        self.ser = None
+        self.buf = bytearray()
+        self.retry_at = 0.0
+        self.backoff = 0.0
+        self.lines = 0
+
+
+class ReaderLoop:
+    """One thread, N serial ports. `ports` maps a door id to its device path."""
+
+    def __init__(self, ports, handle_line, baudrate=9600, opener=open_serial,
+                 reconnect_seconds=2.0, max_reconnect_seconds=30.0, on_reply=None):
+        self.ports = {door: _Port(door, path) for door, path in ports.items()}
+        self.handle_line = handle_line
+        self.on_reply = on_reply
+        self.baudrate = baudrate
+        self.opener = opener
+        self.reconnect_seconds = reconnect_seconds
+        self.max_reconnect_seconds = max_reconnect_seconds
+        self._sel = selectors.DefaultSelector()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rfid-readers", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        for port in self.ports.values():
+            self._close(port)
+
+    def stats(self):
+        return {
+            door: {"path": p.path, "open": p.ser is not None, "lines": p.lines}
+            for door, p in self.ports.items()
+        }
+
+    # ------------------ LOOP ------------------
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            wake = now + 1.0
+            for port in self.ports.values():
+                if port.ser is None:
+                    if now >= port.retry_at:
+                        self._open(port)
+                    if port.ser is None:
+                        wake = min(wake, port.retry_at)
+
+            timeout = max(0.0, wake - time.monotonic())
+            if not self._sel.get_map():
+                self._stop.wait(timeout)
+                continue
+            for key, _mask in self._sel.select(timeout):
+                self._read(key.data)
+
+    def _open(self, port):
+        try:
+            port.ser = self.opener(port.path, self.baudrate)
+            self._sel.register(port.ser.fileno(), selectors.EVENT_READ, port)
+        except Exception as e:
+            self._failed(port, e)
+            return
+        port.buf.clear()
+        port.backoff = 0.0
+        print("[RFID]", port.door + ":", "ready on", port.path)
+
+    def _failed(self, port, error):
+        self._close(port)
+        port.backoff = min(max(port.backoff * 2, self.reconnect_seconds), self.max_reconnect_seconds)
+        port.retry_at = time.monotonic() + port.backoff
+        print("[RFID]", port.door + ":", error, "- retry in", port.backoff, "s")
+
+    def _close(self, port):
+        if port.ser is None:
+            return
+        try:
+            self._sel.unregister(port.ser.fileno())
+        except (KeyError, ValueError, OSError):
+            pass
+        try:
+            port.ser.close()
+        except Exception:
+            pass
+        port.ser = None
+
+    def _read(self, port):
+        try:
+            data = port.ser.read(4096)
+            t_read = time.perf_counter()
+            if not data:
+                # readable but empty: the device went away (USB unplugged, pty closed)
+                raise OSError("port closed")
+        except Exception as e:
+            self._failed(port, e)
+            return
+
+        port.buf += data
+        while True:
+            i = port.buf.find(b"\n")
+            if i < 0:
+                break
+            line = bytes(port.buf[:i]).decode("utf-8", errors="ignore").strip()
+            del port.buf[:i + 1]
+            if line:
+                self._line(port, line, t_read)
+        if len(port.buf) > MAX_LINE:
+            port.buf.clear()
+
+    def _line(self, port, line, t_read):
+        port.lines += 1
+        try:
+            reply = self.handle_line(port.door, line)
+        except Exception as e:
+            print("[RFID]", port.door + ":", "handler failed:", e)
+            return
+        if reply:
+            try:
+                port.ser.write(reply)
+            except Exception as e:
+                self._failed(port, e)
+                return
+            if self.on_reply:
+                self.on_reply(port.door, time.perf_counter() - t_read)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""Run app.py without the Pi: fake Arduinos, mock GPIO, synthetic camera, load.
+
+  - FakeArduino: a pty that speaks the arduino.c protocol (RFID_READY,
+    UID:<hex> lines, reads the AUTH/DENY replies and times them)
+  - setup_environment(): gpiozero MockFactory (PWM pins for the RGB LED),
+    synthetic camera and a scratch data dir, must run before `import app`
+  - MockPir: drives the mock GPIO pin of a motion zone
+  - LoadGenerator: badge scans and motion edges at configurable rates
+
+    python -m simulator --doors 2 --zones 2 --scale 10 --duration 30
+"""
+
+from simulator.arduino import FakeArduino
+from simulator.hardware import MockPir, setup_environment
+from simulator.load import LoadGenerator
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""python -m simulator: start app.py on fake hardware, generate load, print a JSON report."""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from simulator.arduino import FakeArduino
+from simulator.hardware import MockPir, setup_environment
+from simulator.load import LoadGenerator
+
+FIRST_PIR_PIN = 5
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PI SPACE H SECURITY on simulated hardware")
+    parser.add_argument("--doors", type=int, default=1)
+    parser.add_argument("--zones", type=int, default=1)
+    parser.add_argument("--scale", type=float, default=10.0, help="multiple of the real event rates")
+    parser.add_argument("--scan-rate", type=float, help="scans per door and second (overrides --scale)")
+    parser.add_argument("--motion-rate", type=float, help="motion edges per zone and second (overrides --scale)")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--cooldown", type=float, help="motion cooldown per zone in seconds")
+    parser.add_argument("--camera", default="synthetic", help='"synthetic", "ffmpeg" or "" (fswebcam)')
+    parser.add_argument("--data-dir", help="default: a new temporary directory")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="also serve the dashboard")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="pi-space-sim-")
+    arduinos = [FakeArduino("door%d" % (i + 1)) for i in range(args.doors)]
+    zone_pins = {"zone%d" % (i + 1): FIRST_PIR_PIN + i for i in range(args.zones)}
+    setup_environment(data_dir, {a.door: a.path for a in arduinos}, zone_pins,
+                      camera=args.camera, motion_cooldown=args.cooldown)
+
+    import app
+
+    app.create_app()   # starts readers, zones, capture and the DB writer
+
+    if args.serve:
+        threading.Thread(
+            target=app.app.run, kwargs={"host": "0.0.0.0", "port": args.serve, "threaded": True}, daemon=True
+        ).start()
+
+    time.sleep(1.0)   # readers open their ports
+    for a in arduinos:
+        a.boot()
+    pirs = [MockPir(zone, pin) for zone, pin in zone_pins.items()]
+
+    gen = LoadGenerator.scaled(arduinos, pirs, args.scale, known_uids=list(app.credentials.current.cards),
+                               seed=args.seed)
+    if args.scan_rate is not None:
+        gen.scan_rate = args.scan_rate
+    if args.motion_rate is not None:
+        gen.motion_rate = args.motion_rate
+
+    print("[SIM] data in", data_dir, "- %.3f scans/s per door, %.3f motions/s per zone for %ss"
+          % (gen.scan_rate, gen.motion_rate, args.duration))
+    elapsed = gen.run(args.duration)
+    settle(app)
+
+    report = {
+        "duration": round(elapsed, 2),
+        "scan_rate": gen.scan_rate,
+        "motion_rate": gen.motion_rate,
+        "doors": [a.stats() for a in arduinos],
+        "zones": app.motion_zones.stats(),
+        "capture": app.capture_pool.stats(),
+        "events": event_counts(app),
+        "writer_pending": app.db_writer.pending(),
+    }
+    print(json.dumps(report, indent=2))
+
+    for a in arduinos:
+        a.close()
+    app.shutdown_thumb_pool()
+    os._exit(0)   # daemon threads of the app (readers, capture, writer) are not joinable
+
+
+def settle(app, timeout=10.0):
+    """Wait until captures and writes triggered by the load are done."""
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        cap = app.capture_pool.stats()
+        if not cap["queue_depth"] and not cap["in_flight"] and not app.db_writer.pending():
+            return
+        time.sleep(0.1)
+
+
+def event_counts(app):
+    conn = app.get_events_db()
+    rows = conn.execute("SELECT type, COALESCE(status, ''), COUNT(*) FROM events GROUP BY 1, 2").fetchall()
+    conn.close()
+    return {(t + " " + s).strip(): n for t, s, n in rows}
+
+
+if __name__ == "__main__":
+    main()
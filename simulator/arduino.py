@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Fake RFID Arduino on a pseudo terminal."""
+
+import os
+import select
+import threading
+import time
+import tty
+from collections import deque
+
+from tracing import percentiles
+
+
+class FakeArduino:
+    """The app opens `path` like /dev/ttyACM0; scan() sends a card like arduino.c does.
+
+    Replies (AUTH/DENY) are matched to the scans in order and timed from
+    writing the UID line to reading the reply line.
+    """
+
+    def __init__(self, door):
+        self.door = door
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)   # no echo of our own lines
+        self.path = os.ttyname(self._slave)
+        self._lock = threading.Lock()
+        self._pending = deque()   # send times of scans without reply
+        self.sent = 0
+        self.replies = {"AUTH": 0, "DENY": 0}
+        self.latencies = []       # seconds
+        self._closed = False
+        self._thread = threading.Thread(target=self._read_replies, name="fake-arduino-" + door, daemon=True)
+        self._thread.start()
+
+    def boot(self):
+        self._write("RFID_READY")
+
+    def scan(self, uid):
+        with self._lock:
+            self._pending.append(time.perf_counter())
+            self.sent += 1
+        self._write("UID:" + uid)
+
+    def _write(self, line):
+        # Serial.println() ends lines with \r\n
+        os.write(self._master, (line + "\r\n").encode("ascii"))
+
+    def _read_replies(self):
+        buf = b""
+        while not self._closed:
+            try:
+                ready, _, _ = select.select([self._master], [], [], 0.2)
+                if not ready:
+                    continue
+                data = os.read(self._master, 1024)
+            except OSError:
+                return
+            now = time.perf_counter()
+            buf += data
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+                reply = line.strip().decode("ascii", errors="ignore")
+                if reply not in self.replies:
+                    continue
+                with self._lock:
+                    self.replies[reply] += 1
+                    if self._pending:
+                        self.latencies.append(now - self._pending.popleft())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "door": self.door,
+                "sent": self.sent,
+                "replies": dict(self.replies),
+                "unanswered": len(self._pending),
+                "latency_ms": percentiles(self.latencies),
+            }
+
+    def close(self):
+        self._closed = True
+        self._thread.join(timeout=1)
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Mock GPIO, synthetic camera and configuration for a simulated app."""
+
+import os
+import time
+
+
+def setup_environment(data_dir, readers, zones, camera="synthetic", motion_cooldown=None):
+    """Point app.py at fake hardware. Call before `import app`.
+
+    readers: {door: pty path}, zones: {zone: GPIO pin}. The RGB LED needs
+    PWM pins, so the mock factory uses MockPWMPin.
+    """
+    os.environ["GPIOZERO_PIN_FACTORY"] = "mock"
+    os.environ["GPIOZERO_MOCK_PIN_CLASS"] = "mockpwmpin"
+    os.environ["PI_SPACE_DATA_DIR"] = data_dir
+    os.environ["PI_SPACE_CAMERA_SOURCE"] = camera or ""
+    os.environ["PI_SPACE_RFID_READERS"] = ",".join("%s=%s" % kv for kv in readers.items())
+    os.environ["PI_SPACE_MOTION_ZONES"] = ",".join("%s=%d" % kv for kv in zones.items())
+    if motion_cooldown is not None:
+        os.environ["PI_SPACE_MOTION_COOLDOWN"] = str(motion_cooldown)
+
+
+class MockPir:
+    """The PIR of one zone on gpiozero's mock pin factory."""
+
+    def __init__(self, zone, pin):
+        from gpiozero import Device
+
+        self.zone = zone
+        self.pin = Device.pin_factory.pin(pin)
+        self.edges = 0
+
+    def motion(self, hold_seconds=0.2):
+        """One rising edge, held for `hold_seconds` (like a PIR's output pulse)."""
+        self.pin.drive_high()
+        self.edges += 1
+        if hold_seconds:
+            time.sleep(hold_seconds)
+        self.pin.drive_low()
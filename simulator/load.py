@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Badge scans and motion edges at configurable rates."""
+
+import random
+import threading
+import time
+
+# what one door / one zone sees on a normal day, --scale multiplies these
+REAL_SCANS_PER_HOUR = 30
+REAL_MOTIONS_PER_HOUR = 60
+
+
+class LoadGenerator:
+    """Poisson arrivals: one thread per fake Arduino and per PIR.
+
+    scan_rate / motion_rate are per door / per zone and second. Of the scans
+    `known_share` use a card from `known_uids`, the rest random unknown UIDs.
+    """
+
+    def __init__(self, arduinos, pirs, scan_rate, motion_rate, known_uids=(),
+                 known_share=0.8, motion_hold_seconds=0.2, seed=None):
+        self.arduinos = list(arduinos)
+        self.pirs = list(pirs)
+        self.scan_rate = scan_rate
+        self.motion_rate = motion_rate
+        self.known_uids = list(known_uids)
+        self.known_share = known_share
+        self.motion_hold_seconds = motion_hold_seconds
+        self._random = random.Random(seed)
+        self._stop = threading.Event()
+
+    @classmethod
+    def scaled(cls, arduinos, pirs, scale, **kwargs):
+        """Rates as a multiple of the real ones (scale=10: ten times a normal day)."""
+        return cls(arduinos, pirs, scale * REAL_SCANS_PER_HOUR / 3600.0,
+                   scale * REAL_MOTIONS_PER_HOUR / 3600.0, **kwargs)
+
+    def run(self, duration):
+        """Generate load for `duration` seconds, returns the wall time it took."""
+        self._stop.clear()
+        threads = []
+        for a in self.arduinos:
+            threads.append(threading.Thread(target=self._paced, args=(self.scan_rate, lambda a=a: a.scan(self._uid()))))
+        for p in self.pirs:
+            threads.append(threading.Thread(target=self._paced, args=(self.motion_rate, lambda p=p: p.motion(self.motion_hold_seconds))))
+
+        start = time.perf_counter()
+        for t in threads:
+            t.daemon = True
+            t.start()
+        self._stop.wait(duration)
+        self._stop.set()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - start
+
+    def stop(self):
+        self._stop.set()
+
+    def _uid(self):
+        if self.known_uids and self._random.random() < self.known_share:
+            return self._random.choice(self.known_uids)
+        return "%08X" % self._random.getrandbits(32)
+
+    def _paced(self, rate, action):
+        if rate <= 0:
+            return
+        while not self._stop.wait(self._random.expovariate(rate)):
+            action()
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""/events on asyncio: thousands of idle dashboards without a thread each.
+
+Flask's threaded server blocks one thread per open event stream. This
+server runs all streams as coroutines on one event loop in one thread.
+It is attached to the app's EventBroadcaster as a single sink: publish()
+costs one call_soon_threadsafe per event, the fan-out to the clients
+happens in the loop.
+
+Every client has a bounded ring like SSESubscriber. Overrunning it means
+a replay from events.db, overrunning it by far drops the client. Dead
+clients are found three ways: EOF on the socket, a write that does not
+drain within `write_timeout` (the peer stopped reading) and TCP
+keepalive for peers that vanished without a FIN. Heartbeat comments keep
+proxies and browsers from timing out idle streams.
+
+Only `GET /events` is served (Last-Event-ID header or ?lastEventId=).
+No CORS by default, the dashboard reaches it through a reverse proxy on
+its own origin. `allow_origin` lets exactly that one other origin (the
+dashboard on the Flask port) connect to the port directly.
+"""
+
+import asyncio
+import socket
+import threading
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+MAX_HEADER_BYTES = 8192
+
+
+class _Client:
+    def __init__(self, buffer_size):
+        self.buffer = deque(maxlen=buffer_size)
+        self.wake = asyncio.Event()
+        self.skipped = 0
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+
+
+class AsyncSSEServer:
+    """replay(last_id, limit) -> up to `limit` events after it (blocking, runs in a thread),
+    format_event(e) -> SSE message text, on_delivered(e) after a live
+    event was written to a client.
+    """
+
+    def __init__(self, replay, format_event, replay_limit=500, host="0.0.0.0", port=5001, heartbeat=15.0, retry_ms=3000,
+                 client_buffer=256, max_skipped=2048, max_clients=5000, write_timeout=10.0,
+                 header_timeout=10.0, on_delivered=None, reuse_port=False, allow_origin=None):
+        self.replay = replay
+        self.format_event = format_event
+        self.replay_limit = replay_limit
+        self.host = host
+        self.port = port
+        self.heartbeat = heartbeat
+        self.retry_ms = retry_ms
+        self.client_buffer = client_buffer
+        self.max_skipped = max_skipped
+        self.max_clients = max_clients
+        self.write_timeout = write_timeout
+        self.header_timeout = header_timeout
+        self.on_delivered = on_delivered
+        self.reuse_port = reuse_port   # several processes serving one port
+        self.allow_origin = allow_origin
+        self.running = False
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._clients = set()
+        self.served = 0
+        self.dropped_slow = 0
+        self.dropped_dead = 0
+        self.rejected = 0
+
+    def start(self):
+        """Bind and start the loop thread, False if the port could not be bound."""
+        ready = threading.Event()
+        error = []
+
+        def run():
+            loop = self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                self._server = loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port, backlog=1024, limit=MAX_HEADER_BYTES,
+                                         reuse_port=self.reuse_port)
+                )
+            except OSError as e:
+                error.append(e)
+                ready.set()
+                loop.close()
+                return
+            self.running = True
+            ready.set()
+            loop.run_forever()
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="sse-async", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if error:
+            print("[SSE] async server on port", self.port, "failed:", error[0])
+            return False
+        print("[SSE] async /events on port", self.port)
+        return True
+
+    def stop(self):
+        if not self.running:
+            return
+
+        def shutdown():
+            self._server.close()
+            for client in list(self._clients):
+                client.close()
+            self._loop.call_later(0.1, self._loop.stop)
+
+        self.running = False
+        self._loop.call_soon_threadsafe(shutdown)
+        self._thread.join(timeout=2)
+
+    def push(self, event):
+        """EventBroadcaster sink, called on the DB writer thread."""
+        if self.running:
+            self._loop.call_soon_threadsafe(self._fanout, event)
+
+    def client_count(self):
+        return len(self._clients)
+
+    def stats(self):
+        return {
+            "port": self.port,
+            "running": self.running,
+            "clients": len(self._clients),
+            "served": self.served,
+            "dropped_slow": self.dropped_slow,
+            "dropped_dead": self.dropped_dead,
+            "rejected": self.rejected,
+        }
+
+    # ------------------ LOOP ------------------
+    def _fanout(self, event):
+        for client in self._clients:
+            if client.closed:
+                continue
+            if len(client.buffer) == client.buffer.maxlen:
+                client.skipped += 1
+                if client.skipped > self.max_skipped:
+                    self.dropped_slow += 1
+                    client.close()
+                    continue
+            client.buffer.append(event)
+            client.wake.set()
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.header_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        method, target, headers = _parse_head(head)
+        url = urlsplit(target)
+        if method != "GET" or url.path != "/events":
+            await self._reply(writer, "404 Not Found")
+            return
+        if len(self._clients) >= self.max_clients:
+            self.rejected += 1
+            await self._reply(writer, "503 Service Unavailable")
+            return
+
+        last_id = _parse_id(headers.get("last-event-id") or parse_qs(url.query).get("lastEventId", [None])[0])
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        # subscribe before replaying so nothing falls between replay and live
+        client = _Client(self.client_buffer)
+        self._clients.add(client)
+        self.served += 1
+        # the client never sends anything after the request: any read result means it is gone
+        eof = asyncio.ensure_future(reader.read(1))
+        eof.add_done_callback(lambda _f: client.close())
+        cors = ""
+        if self.allow_origin and headers.get("origin") == self.allow_origin:
+            cors = "Access-Control-Allow-Origin: %s\r\nVary: Origin\r\n" % self.allow_origin
+        try:
+            writer.write((
+                "HTTP/1.1 200 OK\r\n"
+                "Content-Type: text/event-stream; charset=utf-8\r\n"
+                "Cache-Control: no-cache\r\n"
+                "Connection: close\r\n"
+                "%s"
+                "X-Accel-Buffering: no\r\n\r\n"
+                "retry: %d\n\n" % (cors, self.retry_ms)
+            ).encode())
+            if last_id is not None:
+                last_id = await self._replay(writer, last_id)
+            await self._drain(writer)
+
+            while not client.closed:
+                if not client.buffer:
+                    try:
+                        await asyncio.wait_for(client.wake.wait(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        writer.write(b": keepalive\n\n")
+                        await self._drain(writer)
+                        continue
+                client.wake.clear()
+                if client.closed:
+                    break
+
+                batch = list(client.buffer)
+                client.buffer.clear()
+                skipped, client.skipped = client.skipped, 0
+                if skipped and last_id is not None:
+                    # ring overran: fill the gap from events.db first
+                    last_id = await self._replay(writer, last_id)
+
+                sent = []
+                for e in batch:
+                    eid = e.get("id")
+                    if eid is not None and last_id is not None and eid <= last_id:
+                        continue   # already sent by a replay
+                    writer.write(self.format_event(e).encode("utf-8"))
+                    sent.append(e)
+                    if eid is not None:
+                        last_id = eid
+                await self._drain(writer)
+                if self.on_delivered:
+                    for e in sent:
+                        self.on_delivered(e)
+        except (ConnectionError, asyncio.TimeoutError, OSError):
+            self.dropped_dead += 1
+        finally:
+            self._clients.discard(client)
+            eof.cancel()
+            writer.close()
+
+    async def _replay(self, writer, last_id):
+        # page by page until a short page: a long gap is not cut off at one page
+        loop = asyncio.get_running_loop()
+        while True:
+            events = await loop.run_in_executor(None, self.replay, last_id, self.replay_limit)
+            for e in events:
+                writer.write(self.format_event(e).encode("utf-8"))
+                last_id = e["id"]
+            if len(events) < self.replay_limit:
+                return last_id
+            await self._drain(writer)
+
+    async def _drain(self, writer):
+        # a client that stopped reading fills the socket buffer, drain() then never returns
+        await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    async def _reply(self, writer, status):
+        writer.write(("HTTP/1.1 %s\r\nContent-Length: 0\r\nConnection: close\r\n\r\n" % status).encode())
+        try:
+            await asyncio.wait_for(writer.drain(), self.write_timeout)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        writer.close()
+
+
+def _parse_head(head):
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    method, target = (parts[0], parts[1]) if len(parts) >= 2 else ("", "")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""create_app(config) must use every setting it accepts.
+
+create_app() runs once per process, so every case starts the app in a
+fresh interpreter on mock GPIO pins and a fake serial opener.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, os, sys, time
+import app
+
+opened = []
+
+def opener(path, baudrate):
+    opened.append(path)
+    raise OSError("no device")
+
+app.create_app(dict(json.loads(sys.argv[2]), DATA_DIR=sys.argv[1], SERIAL_OPENER=opener,
+                    CAMERA_SOURCE=None, SSE_ASYNC_PORT=None))
+deadline = time.time() + 5
+while not opened and time.time() < deadline:
+    time.sleep(0.05)
+print(json.dumps({
+    "opened": opened,
+    "zones": [[z.name, z.pin, z.cooldown] for z in app.motion_zones.zones],
+}))
+sys.stdout.flush()
+app.shutdown_thumb_pool()
+os._exit(0)
+"""
+
+
+def start(tmp_path, config, **env):
+    environ = dict(os.environ, GPIOZERO_PIN_FACTORY="mock", GPIOZERO_MOCK_PIN_CLASS="mockpwmpin",
+                   PYTHONPATH=ROOT, **env)
+    for name in ("PI_SPACE_RFID_READERS", "PI_SPACE_MOTION_ZONES", "PI_SPACE_MOTION_COOLDOWN"):
+        if name not in env:
+            environ.pop(name, None)
+    out = subprocess.run([sys.executable, "-c", CHILD, str(tmp_path), json.dumps(config)], cwd=ROOT,
+                         env=environ, stdout=subprocess.PIPE, check=True, timeout=60).stdout
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def test_serial_port_pir_pin_and_cooldown_are_used(tmp_path):
+    used = start(tmp_path, {"SERIAL_PORT": "/dev/ttyTEST0", "PIR_PIN": 21, "MOTION_COOLDOWN_SECONDS": 0.5})
+    assert used["opened"][0] == "/dev/ttyTEST0"
+    assert used["zones"] == [["main", 21, 0.5]]
+
+
+def test_cooldown_applies_to_zones_from_the_environment(tmp_path):
+    used = start(tmp_path, {"MOTION_COOLDOWN_SECONDS": 0.25}, PI_SPACE_MOTION_ZONES="front=5,back=6")
+    assert used["zones"] == [["front", 5, 0.25], ["back", 6, 0.25]]
+
+
+def test_explicit_lists_win_over_the_single_settings(tmp_path):
+    used = start(tmp_path, {
+        "SERIAL_PORT": "/dev/ttyIGNORED", "PIR_PIN": 21,
+        "RFID_READERS": {"door": "/dev/ttyTEST1"},
+        "MOTION_ZONES": [{"zone": "yard", "pin": 7, "cooldown": 1.5, "camera": None}],
+    })
+    assert used["opened"][0] == "/dev/ttyTEST1"
+    assert used["zones"] == [["yard", 7, 1.5]]
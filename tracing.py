@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Per-event stage timings, linked by event_id.
+
+A trace starts at the sensor edge (start()) and collects one span per
+pipeline stage: span(event_id, stage, start, end) with time.monotonic()
+values. The first span of a stage wins, so coalesced triggers and several
+SSE clients do not overwrite it. Spans of unknown event ids are ignored,
+which keeps untraced events (RFID, uploads) at one dict lookup.
+
+The last `max_traces` traces are kept for /debug/trace/<event_id>, the
+last `window` durations of every stage for the rolling percentiles.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """{"n": .., "p50": ms, ..., "max": ms} of a list of seconds."""
+    values = sorted(values)
+    out = {"n": len(values)}
+    if not values:
+        return out
+    for p in points:
+        i = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+        out["p%d" % p] = round(values[i] * 1000, 2)
+    out["max"] = round(values[-1] * 1000, 2)
+    return out
+
+
+class _Trace:
+    def __init__(self, origin, epoch):
+        self.origin = origin
+        self.epoch = epoch
+        self.spans = {}   # stage -> (start, end), in insertion order
+
+
+class Tracer:
+    def __init__(self, max_traces=500, window=1000, on_span=None):
+        self.max_traces = max_traces
+        self.window = window
+        self.on_span = on_span   # on_span(stage, seconds), e.g. a histogram
+        self._lock = threading.Lock()
+        self._traces = OrderedDict()
+        self._durations = {}      # stage -> deque of seconds
+
+    def start(self, trace_id, origin=None):
+        """Begin a trace at `origin` (monotonic, default now); no-op if it exists."""
+        if not trace_id:
+            return
+        with self._lock:
+            if trace_id in self._traces:
+                return
+            self._traces[trace_id] = _Trace(time.monotonic() if origin is None else origin, time.time())
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def drop(self, trace_id):
+        with self._lock:
+            self._traces.pop(trace_id, None)
+
+    def span(self, trace_id, stage, start, end=None):
+        """Record a stage of a started trace, True if it was recorded."""
+        if not trace_id:
+            return False
+        if end is None:
+            end = time.monotonic()
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None or stage in trace.spans:
+                return False
+            trace.spans[stage] = (start, end)
+            durations = self._durations.get(stage)
+            if durations is None:
+                durations = self._durations[stage] = deque(maxlen=self.window)
+            durations.append(end - start)
+        if self.on_span:
+            self.on_span(stage, end - start)
+        return True
+
+    def after(self, trace_id, stage, previous, end=None):
+        """Record `stage` as starting where the stage `previous` ended."""
+        if not trace_id:
+            return False
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            prev = trace.spans.get(previous) if trace else None
+        if prev is None:
+            return False
+        return self.span(trace_id, stage, prev[1], end)
+
+    def get(self, trace_id):
+        """The trace as a dict (times in ms relative to its start), None if unknown."""
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                return None
+            spans = sorted(trace.spans.items(), key=lambda kv: kv[1])
+        ms = lambda t: round((t - trace.origin) * 1000, 2)
+        return {
+            "event_id": trace_id,
+            "epoch": trace.epoch,
+            "total_ms": max((ms(end) for _s, (_b, end) in spans), default=0.0),
+            "stages": [
+                {"stage": stage, "start_ms": ms(start), "end_ms": ms(end),
+                 "duration_ms": round((end - start) * 1000, 2)}
+                for stage, (start, end) in spans
+            ],
+        }
+
+    def recent(self, limit=20):
+        with self._lock:
+            return list(self._traces)[-limit:][::-1]
+
+    def summary(self):
+        """{stage: percentiles} over the last `window` spans of every stage."""
+        with self._lock:
+            durations = {stage: list(d) for stage, d in self._durations.items()}
+        return {stage: percentiles(values) for stage, values in durations.items()}
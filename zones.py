@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""PIR motion zones driven by gpiozero edge callbacks.
+
+Every zone is one PIR sensor with a name, its own cooldown and the camera
+that takes its photo (None: motion events only). The sensors do not get a
+blocked thread each: their edge callbacks only stamp the time and put the
+edge on one queue, a single dispatcher thread applies the cooldowns and
+calls on_motion(zone, trigger_ts) in edge order.
+
+The sensors are gpiozero DigitalInputDevices (pin interrupts, no sampling
+thread per sensor like MotionSensor has). Pass pin_factory=MockFactory() to
+run without hardware; gpiozero is imported on start().
+"""
+
+import queue
+import threading
+import time
+
+
+class Zone:
+    def __init__(self, name, pin, cooldown=2.0, camera="default"):
+        self.name = name
+        self.pin = pin
+        self.cooldown = cooldown
+        self.camera = camera
+        self.sensor = None
+        self.active = False
+        self.last_trigger = None   # time.monotonic() of the last accepted trigger
+        self.edges = 0
+        self.triggers = 0
+        self.suppressed = 0        # edges within the cooldown
+
+
+class ZoneEngine:
+    """`zones` is a list of Zone; on_motion(zone, trigger_ts) runs on the dispatcher thread."""
+
+    def __init__(self, zones, on_motion, pin_factory=None, bounce_time=None):
+        self.zones = list(zones)
+        self.on_motion = on_motion
+        self.pin_factory = pin_factory
+        self.bounce_time = bounce_time
+        self._edges = queue.SimpleQueue()
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return self
+        from gpiozero import DigitalInputDevice
+
+        for zone in self.zones:
+            try:
+                zone.sensor = DigitalInputDevice(
+                    zone.pin, pull_up=False, bounce_time=self.bounce_time, pin_factory=self.pin_factory
+                )
+            except Exception as e:
+                print("[MOTION]", zone.name + ":", "GPIO", zone.pin, "failed:", e)
+                continue
+            # runs on gpiozero's callback thread: stamp and hand over, nothing else
+            zone.sensor.when_activated = lambda _dev, z=zone: self._edges.put((z, True, time.monotonic()))
+            zone.sensor.when_deactivated = lambda _dev, z=zone: self._edges.put((z, False, time.monotonic()))
+            print("[MOTION]", zone.name + ":", "ready on GPIO", zone.pin)
+
+        self._thread = threading.Thread(target=self._dispatch, name="motion-dispatch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        for zone in self.zones:
+            if zone.sensor:
+                zone.sensor.close()
+                zone.sensor = None
+        if self._thread:
+            self._edges.put(None)
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def stats(self):
+        return {
+            z.name: {
+                "pin": z.pin,
+                "camera": z.camera,
+                "active": z.active,
+                "edges": z.edges,
+                "triggers": z.triggers,
+                "suppressed": z.suppressed,
+            }
+            for z in self.zones
+        }
+
+    def _dispatch(self):
+        while True:
+            item = self._edges.get()
+            if item is None:
+                return
+            zone, active, ts = item
+            zone.active = active
+            if not active:
+                continue
+            zone.edges += 1
+            if zone.last_trigger is not None and ts - zone.last_trigger < zone.cooldown:
+                zone.suppressed += 1
+                continue
+            zone.last_trigger = ts
+            zone.triggers += 1
+            try:
+                self.on_motion(zone, ts)
+            except Exception as e:
+                print("[MOTION]", zone.name + ":", "handler failed:", e)